@@ -1,653 +1,1320 @@
-import warnings
-import functools
-from typing import Union, Optional, Callable, Tuple, Sequence
-import torch
-import numpy as np
-from xitorch import LinearOperator
-from scipy.sparse.linalg import gmres as scipy_gmres
-from xitorch._impls.optimize.root.rootsolver import broyden1
-from xitorch._utils.bcast import normalize_bcast_dims, get_bcasted_dims
-from xitorch._utils.exceptions import ConvergenceWarning
-from xitorch._utils.types import get_np_dtype
-
-__all__ = ["wrap_gmres", "cg", "bicgstab", "broyden1_solve", "exactsolve", "gmres"]
-
-def wrap_gmres(A, B, E=None, M=None,
-               min_eps=1e-9,
-               max_niter=None,
-               **unused):
-    """
-    Using SciPy's gmres method to solve the linear equation.
-
-    Keyword arguments
-    -----------------
-    min_eps: float
-        Relative tolerance for stopping conditions
-    max_niter: int or None
-        Maximum number of iterations. If ``None``, default to twice of the
-        number of columns of ``A``.
-    """
-    # A: (*BA, nr, nr)
-    # B: (*BB, nr, ncols)
-    # E: (*BE, ncols) or None
-    # M: (*BM, nr, nr) or None
-
-    # NOTE: currently only works for batched B (1 batch dim), but unbatched A
-    assert len(A.shape) == 2 and len(B.shape) == 3, "Currently only works for batched B (1 batch dim), but unbatched A"
-    assert not torch.is_complex(B), "complex is not supported in gmres"
-
-    # check the parameters
-    msg = "GMRES can only do AX=B"
-    assert A.shape[-2] == A.shape[-1], "GMRES can only work for square operator for now"
-    assert E is None, msg
-    assert M is None, msg
-
-    nbatch, na, ncols = B.shape
-    if max_niter is None:
-        max_niter = 2 * na
-
-    B = B.transpose(-1, -2)  # (nbatch, ncols, na)
-
-    # convert the numpy/scipy
-    op = A.scipy_linalg_op()
-    B_np = B.detach().cpu().numpy()
-    res_np = np.empty(B.shape, dtype=get_np_dtype(B.dtype))
-    for i in range(nbatch):
-        for j in range(ncols):
-            x, info = scipy_gmres(op, B_np[i, j, :], tol=min_eps, atol=1e-12, maxiter=max_niter)
-            if info > 0:
-                msg = "The GMRES iteration does not converge to the desired value "\
-                      "(%.3e) after %d iterations" % \
-                      (min_eps, info)
-                warnings.warn(ConvergenceWarning(msg))
-            res_np[i, j, :] = x
-
-    res = torch.tensor(res_np, dtype=B.dtype, device=B.device)
-    res = res.transpose(-1, -2)  # (nbatch, na, ncols)
-    return res
-
-def cg(A: LinearOperator, B: torch.Tensor,
-        E: Optional[torch.Tensor] = None,
-        M: Optional[LinearOperator] = None,
-        posdef: Optional[bool] = None,
-        precond: Optional[LinearOperator] = None,
-        max_niter: Optional[int] = None,
-        rtol: float = 1e-6,
-        atol: float = 1e-8,
-        eps: float = 1e-12,
-        resid_calc_every: int = 10,
-        verbose: bool = False,
-        **unused) -> torch.Tensor:
-    r"""
-    Solve the linear equations using Conjugate-Gradient (CG) method.
-
-    Keyword arguments
-    -----------------
-    posdef: bool or None
-        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
-        definite for all columns and batches.
-        If None, it will be determined by power iterations.
-    precond: LinearOperator or None
-        LinearOperator for the preconditioning. If None, no preconditioner is
-        applied.
-    max_niter: int or None
-        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
-    rtol: float
-        Relative tolerance for stopping condition w.r.t. norm of B
-    atol: float
-        Absolute tolerance for stopping condition w.r.t. norm of B
-    eps: float
-        Substitute the absolute zero in the algorithm's denominator with this
-        value to avoid nan.
-    resid_calc_every: int
-        Calculate the residual in its actual form instead of substitution form
-        with this frequency, to avoid rounding error accummulation.
-        If your linear operator has bad numerical precision, set this to be low.
-        If 0, then never calculate the residual in its actual form.
-    verbose: bool
-        Verbosity of the algorithm.
-    """
-    nr = A.shape[-1]
-    ncols = B.shape[-1]
-    if max_niter is None:
-        max_niter = int(1.5 * nr)
-
-    # if B is all zeros, then return zeros
-    batchdims = _get_batchdims(A, B, E, M)
-    if torch.allclose(B, B * 0, rtol=rtol, atol=atol):
-        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
-        return x0
-
-    # setup the preconditioning and the matrix problem
-    precond_fcn = _setup_precond(precond)
-    need_hermit = True
-    A_fcn, _, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
-                                                      posdef, need_hermit)
-
-    # get the stopping matrix
-    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
-    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
-
-    # prepare the initial guess (it's just all zeros)
-    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
-    xk = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
-
-    rk = B2 - A_fcn(xk)  # (*, nr, nc)
-    zk = precond_fcn(rk)  # (*, nr, nc)
-    pk = zk  # (*, nr, nc)
-    rkzk = _dot(rk, zk)
-    converge = False
-    best_resid = rk.norm(dim=-2).max().item()
-    best_xk = xk
-    for k in range(1, max_niter + 1):
-        Apk = A_fcn(pk)
-        alphak = rkzk / _safedenom(_dot(pk, Apk), eps)
-        xk_1 = xk + alphak * pk
-
-        # correct the residual calculation
-        if resid_calc_every != 0 and k % resid_calc_every == 0:
-            rk_1 = B2 - A_fcn(xk_1)
-        else:
-            rk_1 = rk - alphak * Apk  # (*, nr, nc)
-
-        # check for the stopping condition
-        resid = rk_1  # B2 - A_fcn(xk_1)
-        resid_norm = resid.norm(dim=-2, keepdim=True)
-
-        max_resid_norm = resid_norm.max().item()
-        if max_resid_norm < best_resid:
-            best_resid = max_resid_norm
-            best_xk = xk_1
-
-        if verbose:
-            if k < 10 or k % 10 == 0:
-                print("%4d: |dy|=%.3e" % (k, resid_norm))
-
-        if torch.all(resid_norm < stop_matrix):
-            converge = True
-            break
-
-        zk_1 = precond_fcn(rk_1)
-        rkzk_1 = _dot(rk_1, zk_1)
-        betak = rkzk_1 / _safedenom(rkzk, eps)
-        pk_1 = zk_1 + betak * pk
-
-        # move to the next index
-        pk = pk_1
-        zk = zk_1
-        xk = xk_1
-        rk = rk_1
-        rkzk = rkzk_1
-
-    xk_1 = best_xk
-    if not converge:
-        msg = ("Convergence is not achieved after %d iterations. "
-               "Max norm of best resid: %.3e") % (max_niter, best_resid)
-        warnings.warn(ConvergenceWarning(msg))
-    if col_swapped:
-        # x: (ncols, *, nr, 1)
-        xk_1 = xk_1.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
-    return xk_1
-
-def bicgstab(A: LinearOperator, B: torch.Tensor,
-             E: Optional[torch.Tensor] = None,
-             M: Optional[LinearOperator] = None,
-             posdef: Optional[bool] = None,
-             precond_l: Optional[LinearOperator] = None,
-             precond_r: Optional[LinearOperator] = None,
-             max_niter: Optional[int] = None,
-             rtol: float = 1e-6,
-             atol: float = 1e-8,
-             eps: float = 1e-12,
-             verbose: bool = False,
-             resid_calc_every: int = 10,
-             **unused) -> torch.Tensor:
-    r"""
-    Solve the linear equations using stabilized Biconjugate-Gradient method.
-
-    Keyword arguments
-    -----------------
-    posdef: bool or None
-        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
-        definite for all columns and batches.
-        If None, it will be determined by power iterations.
-    precond_l: LinearOperator or None
-        LinearOperator for the left preconditioning. If None, no
-        preconditioner is applied.
-    precond_r: LinearOperator or None
-        LinearOperator for the right preconditioning. If None, no
-        preconditioner is applied.
-    max_niter: int or None
-        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
-    rtol: float
-        Relative tolerance for stopping condition w.r.t. norm of B
-    atol: float
-        Absolute tolerance for stopping condition w.r.t. norm of B
-    eps: float
-        Substitute the absolute zero in the algorithm's denominator with this
-        value to avoid nan.
-    resid_calc_every: int
-        Calculate the residual in its actual form instead of substitution form
-        with this frequency, to avoid rounding error accummulation.
-        If your linear operator has bad numerical precision, set this to be low.
-        If 0, then never calculate the residual in its actual form.
-    verbose: bool
-        Verbosity of the algorithm.
-    """
-    nr, ncols = B.shape[-2:]
-    if max_niter is None:
-        max_niter = int(1.5 * nr)
-
-    # if B is all zeros, then return zeros
-    batchdims = _get_batchdims(A, B, E, M)
-    if torch.allclose(B, B * 0, rtol=rtol, atol=atol):
-        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
-        return x0
-
-    # setup the preconditioning and the matrix problem
-    precond_fcn_l = _setup_precond(precond_l)
-    precond_fcn_r = _setup_precond(precond_r)
-    need_hermit = False
-    A_fcn, AT_fcn, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
-                                                           posdef, need_hermit)
-
-    # get the stopping matrix
-    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
-    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
-
-    # prepare the initial guess (it's just all zeros)
-    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
-    xk = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
-
-    rk = B2 - A_fcn(xk)
-    r0hat = rk
-    rho_k = _dot(r0hat, rk)
-    omega_k = torch.tensor(1.0, dtype=A.dtype, device=A.device)
-    alpha: Union[float, torch.Tensor] = 1.0
-    vk: Union[float, torch.Tensor] = 0.0
-    pk: Union[float, torch.Tensor] = 0.0
-    converge = False
-    best_resid = rk.norm(dim=-2).max()
-    best_xk = xk
-    for k in range(1, max_niter + 1):
-        rho_knew = _dot(r0hat, rk)
-        omega_denom = _safedenom(omega_k, eps)
-        beta = rho_knew / _safedenom(rho_k, eps) * (alpha / omega_denom)
-        pk = rk + beta * (pk - omega_k * vk)
-        y = precond_fcn_r(pk)
-        vk = A_fcn(y)
-        alpha = rho_knew / _safedenom(_dot(r0hat, vk), eps)
-        h = xk + alpha * y
-
-        s = rk - alpha * vk
-        z = precond_fcn_r(s)
-        t = A_fcn(z)
-        Kt = precond_fcn_l(t)
-        omega_k = _dot(Kt, precond_fcn_l(s)) / _safedenom(_dot(Kt, Kt), eps)
-        xk = h + omega_k * z
-
-        # correct the residual calculation regularly
-        if resid_calc_every != 0 and k % resid_calc_every == 0:
-            rk = B2 - A_fcn(xk)
-        else:
-            rk = s - omega_k * t
-
-        # calculate the residual
-        resid = rk
-        resid_norm = resid.norm(dim=-2, keepdim=True)
-
-        # save the best results
-        max_resid_norm = resid_norm.max().item()
-        if max_resid_norm < best_resid:
-            best_resid = max_resid_norm
-            best_xk = xk
-
-        if verbose:
-            if k < 10 or k % 10 == 0:
-                print("%4d: |dy|=%.3e" % (k, resid_norm))
-
-        # check for the stopping conditions
-        if torch.all(resid_norm < stop_matrix):
-            converge = True
-            break
-
-        rho_k = rho_knew
-
-    xk = best_xk
-    if not converge:
-        msg = ("Convergence is not achieved after %d iterations. "
-               "Max norm of resid: %.3e") % (max_niter, best_resid)
-        warnings.warn(ConvergenceWarning(msg))
-    if col_swapped:
-        # x: (ncols, *, nr, 1)
-        xk = xk.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
-    return xk
-
-def gmres(A: LinearOperator, B: torch.Tensor,
-          E: Optional[torch.Tensor] = None,
-          M: Optional[LinearOperator] = None,
-          posdef: Optional[bool] = None,
-          max_niter: Optional[int] = None,
-          rtol: float = 1e-6,
-          atol: float = 1e-8,
-          eps: float = 1e-12,
-          **unused) -> torch.Tensor:
-    r"""
-    Solve the linear equations using Generalised minial residual method.
-
-    Keyword arguments
-    -----------------
-    posdef: bool or None
-        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
-        definite for all columns and batches.
-        If None, it will be determined by power iterations.
-    max_niter: int or None
-        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
-    rtol: float
-        Relative tolerance for stopping condition w.r.t. norm of B
-    atol: float
-        Absolute tolerance for stopping condition w.r.t. norm of B
-    eps: float
-        Substitute the absolute zero in the algorithm's denominator with this
-        value to avoid nan.
-    """
-    converge = False
-
-    nr, ncols = A.shape[-1], B.shape[-1]
-    if max_niter is None:
-        max_niter = int(nr)
-
-    # if B is all zeros, then return zeros
-    batchdims = _get_batchdims(A, B, E, M)
-    if torch.allclose(B, B * 0, rtol=rtol, atol=atol):
-        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
-        return x0
-
-    # setup the preconditioning and the matrix problem
-    need_hermit = False
-    A_fcn, AT_fcn, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
-                                                           posdef, need_hermit)
-
-    # get the stopping matrix
-    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
-    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
-
-    # prepare the initial guess (it's just all zeros)
-    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
-    x0 = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
-
-    r = B2 - A_fcn(x0)  # torch.Size([*batch_dims, nr, ncols])
-    best_resid = r.norm(dim=-2, keepdim=True)  # / B_norm
-
-    best_resid = best_resid.max().item()
-    best_res = x0
-    q = torch.empty([max_niter] + list(r.shape), dtype=A.dtype, device=A.device)
-    q[0] = r / _safedenom(r.norm(dim=-2, keepdim=True), eps)  # torch.Size([*batch_dims, nr, ncols])
-    h = torch.zeros((*batchdims, ncols, max_niter + 1, max_niter), dtype=A.dtype, device=A.device)
-    h = h.reshape((-1, ncols, max_niter + 1, max_niter))
-
-    for k in range(min(nr, max_niter)):
-        y = A_fcn(q[k])  # torch.Size([*batch_dims, nr, ncols])
-        for j in range(k + 1):
-            h[..., j, k] = _dot(q[j], y).reshape(-1, ncols)
-            y = y - h[..., j, k].reshape(*batchdims, 1, ncols) * q[j]
-
-        h[..., k + 1, k] = torch.linalg.norm(y, dim=-2)
-        if torch.any(h[..., k + 1, k]) != 0 and k != max_niter - 1:
-            q[k + 1] = y.reshape(-1, nr, ncols) / h[..., k + 1, k].reshape(-1, 1, ncols)
-            q[k + 1] = q[k + 1].reshape(*batchdims, nr, ncols)
-
-        b = torch.zeros((*batchdims, ncols, k + 1), dtype=A.dtype, device=A.device)
-        b = b.reshape(-1, ncols, k + 1)
-        b[..., 0] = torch.linalg.norm(r, dim=-2)
-        rk = torch.linalg.lstsq(h[..., :k + 1, :k], b)[0]  # torch.Size([*batch_dims, max_niter])
-        # Q, R = torch.linalg.qr(h[:, :k+1, :k], mode='complete')
-        # result = torch.triangular_solve(torch.matmul(Q.permute(0, 2, 1), b[:, :, None])[:, :-1], R[:, :-1, :])[0]
-
-        res = torch.empty([])
-        for i in range(k):
-            res = res + q[i] * rk[..., i].reshape(*batchdims, 1, ncols) + x0 if res.size() \
-                else q[i] * rk[..., i].reshape(*batchdims, 1, ncols) + x0
-            # res = res * B_norm
-
-        if res.size():
-            resid = B2 - A_fcn(res)
-            resid_norm = resid.norm(dim=-2, keepdim=True)
-
-            # save the best results
-            max_resid_norm = resid_norm.max().item()
-            if max_resid_norm < best_resid:
-                best_resid = max_resid_norm
-                best_res = res
-
-            if torch.all(resid_norm < stop_matrix):
-                converge = True
-                break
-
-    if not converge:
-        msg = ("Convergence is not achieved after %d iterations. "
-               "Max norm of resid: %.3e") % (max_niter, best_resid)
-        warnings.warn(ConvergenceWarning(msg))
-
-    res = best_res
-    return res
-
-
-############ cg and bicgstab helpers ############
-def _safedenom(r: torch.Tensor, eps: float) -> torch.Tensor:
-    r[r == 0] = eps
-    return r
-
-def _dot(r: torch.Tensor, z: torch.Tensor) -> torch.Tensor:
-    # r: (*BR, nr, nc)
-    # z: (*BR, nr, nc)
-    # return: (*BR, 1, nc)
-    return torch.einsum("...rc,...rc->...c", r.conj(), z).unsqueeze(-2)
-
-############ rootfinder-based ############
-@functools.wraps(broyden1)
-def broyden1_solve(A, B, E=None, M=None, **options):
-    return _rootfinder_solve("broyden1", A, B, E, M, **options)
-
-def _rootfinder_solve(alg, A, B, E=None, M=None, **options):
-    # using rootfinder algorithm
-    nr = A.shape[-1]
-    ncols = B.shape[-1]
-
-    # set up the function for the rootfinding
-    def fcn_rootfinder(xi):
-        # xi: (*BX, nr*ncols)
-        x = xi.reshape(*xi.shape[:-1], nr, ncols)  # (*BX, nr, ncols)
-        y = A.mm(x) - B  # (*BX, nr, ncols)
-        if E is not None:
-            MX = M.mm(x) if M is not None else x
-            MXE = MX * E.unsqueeze(-2)
-            y = y - MXE  # (*BX, nr, ncols)
-        y = y.reshape(*xi.shape[:-1], -1)  # (*BX, nr*ncols)
-        return y
-
-    # setup the initial guess (the batch dimension must be the largest)
-    batchdims = _get_batchdims(A, B, E, M)
-    x0 = torch.zeros((*batchdims, nr * ncols), dtype=A.dtype, device=A.device)
-
-    if alg == "broyden1":
-        x = broyden1(fcn_rootfinder, x0, **options)
-    else:
-        raise RuntimeError("Unknown method %s" % alg)
-    x = x.reshape(*x.shape[:-1], nr, ncols)
-    return x
-
-############ exact solve ############
-def exactsolve(A: LinearOperator, B: torch.Tensor,
-               E: Union[torch.Tensor, None],
-               M: Union[LinearOperator, None]):
-    """
-    Solve the linear equation by contructing the full matrix of LinearOperators.
-
-    Warnings
-    --------
-    * As this method construct the linear operators explicitly, it might requires
-      a large memory.
-    """
-    # A: (*BA, na, na)
-    # B: (*BB, na, ncols)
-    # E: (*BE, ncols)
-    # M: (*BM, na, na)
-    if E is None:
-        Amatrix = A.fullmatrix()  # (*BA, na, na)
-        x = torch.linalg.solve(Amatrix, B)  # (*BAB, na, ncols)
-    elif M is None:
-        Amatrix = A.fullmatrix()
-        x = _solve_ABE(Amatrix, B, E)
-    else:
-        Mmatrix = M.fullmatrix()  # (*BM, na, na)
-        L = torch.linalg.cholesky(Mmatrix)  # (*BM, na, na)
-        Linv = torch.inverse(L)  # (*BM, na, na)
-        LinvT = Linv.transpose(-2, -1).conj()  # (*BM, na, na)
-        A2 = torch.matmul(Linv, A.mm(LinvT))  # (*BAM, na, na)
-        B2 = torch.matmul(Linv, B)  # (*BBM, na, ncols)
-
-        X2 = _solve_ABE(A2, B2, E)  # (*BABEM, na, ncols)
-        x = torch.matmul(LinvT, X2)  # (*BABEM, na, ncols)
-    return x
-
-def _solve_ABE(A: torch.Tensor, B: torch.Tensor, E: torch.Tensor):
-    # A: (*BA, na, na) matrix
-    # B: (*BB, na, ncols) matrix
-    # E: (*BE, ncols) matrix
-    na = A.shape[-1]
-    BA, BB, BE = normalize_bcast_dims(A.shape[:-2], B.shape[:-2], E.shape[:-1])
-    E = E.reshape(1, *BE, E.shape[-1]).transpose(0, -1)  # (ncols, *BE, 1)
-    B = B.reshape(1, *BB, *B.shape[-2:]).transpose(0, -1)  # (ncols, *BB, na, 1)
-
-    # NOTE: The line below is very inefficient for large na and ncols
-    AE = A - torch.diag_embed(E.repeat_interleave(repeats=na, dim=-1), dim1=-2, dim2=-1)  # (ncols, *BAE, na, na)
-    r = torch.linalg.solve(AE, B)  # (ncols, *BAEM, na, 1)
-    r = r.transpose(0, -1).squeeze(0)  # (*BAEM, na, ncols)
-    return r
-
-############ general helpers ############
-def _get_batchdims(A: LinearOperator, B: torch.Tensor,
-                   E: Union[torch.Tensor, None],
-                   M: Union[LinearOperator, None]):
-
-    batchdims = [A.shape[:-2], B.shape[:-2]]
-    if E is not None:
-        batchdims.append(E.shape[:-1])
-        if M is not None:
-            batchdims.append(M.shape[:-2])
-    return get_bcasted_dims(*batchdims)
-
-def _setup_precond(precond: Optional[LinearOperator]) -> Callable[[torch.Tensor], torch.Tensor]:
-    if isinstance(precond, LinearOperator):
-        precond_fcn = lambda x: precond.mm(x)
-    elif precond is None:
-        precond_fcn = lambda x: x
-    else:
-        raise TypeError("precond can only be LinearOperator or None")
-    return precond_fcn
-
-def _setup_linear_problem(A: LinearOperator, B: torch.Tensor,
-                          E: Optional[torch.Tensor], M: Optional[LinearOperator],
-                          batchdims: Sequence[int],
-                          posdef: Optional[bool],
-                          need_hermit: bool) -> \
-        Tuple[Callable[[torch.Tensor], torch.Tensor],
-              Callable[[torch.Tensor], torch.Tensor],
-              torch.Tensor, bool]:
-
-    # get the linear operator (including the MXE part)
-    if E is None:
-        A_fcn = lambda x: A.mm(x)
-        AT_fcn = lambda x: A.rmm(x)
-        B_new = B
-        col_swapped = False
-    else:
-        # A: (*BA, nr, nr) linop
-        # B: (*BB, nr, ncols)
-        # E: (*BE, ncols)
-        # M: (*BM, nr, nr) linop
-        if M is None:
-            BAs, BBs, BEs = normalize_bcast_dims(A.shape[:-2], B.shape[:-2], E.shape[:-1])
-        else:
-            BAs, BBs, BEs, BMs = normalize_bcast_dims(A.shape[:-2], B.shape[:-2],
-                                                      E.shape[:-1], M.shape[:-2])
-        E = E.reshape(*BEs, *E.shape[-1:])
-        E_new = E.unsqueeze(0).transpose(-1, 0).unsqueeze(-1)  # (ncols, *BEs, 1, 1)
-        B = B.reshape(*BBs, *B.shape[-2:])  # (*BBs, nr, ncols)
-        B_new = B.unsqueeze(0).transpose(-1, 0)  # (ncols, *BBs, nr, 1)
-
-        def A_fcn(x):
-            # x: (ncols, *BX, nr, 1)
-            Ax = A.mm(x)  # (ncols, *BAX, nr, 1)
-            Mx = M.mm(x) if M is not None else x  # (ncols, *BMX, nr, 1)
-            MxE = Mx * E_new  # (ncols, *BMXE, nr, 1)
-            return Ax - MxE
-
-        def AT_fcn(x):
-            # x: (ncols, *BX, nr, 1)
-            ATx = A.rmm(x)
-            MTx = M.rmm(x) if M is not None else x
-            MTxE = MTx * E_new
-            return ATx - MTxE
-
-        col_swapped = True
-
-    # estimate if it's posdef with power iteration
-    if need_hermit:
-        is_hermit = A.is_hermitian and (M is None or M.is_hermitian)
-        if not is_hermit:
-            # set posdef to False to make the operator becomes AT * A so it is
-            # hermitian
-            posdef = False
-
-    # TODO: the posdef check by largest eival only works for Hermitian/symmetric
-    # matrix, but it doesn't always work for non-symmetric matrix.
-    # In non-symmetric case, one need to do Cholesky LDL decomposition
-    if posdef is None:
-        nr, ncols = B.shape[-2:]
-        x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
-        x0 = torch.randn(x0shape, dtype=A.dtype, device=A.device)
-        x0 = x0 / x0.norm(dim=-2, keepdim=True)
-        largest_eival = _get_largest_eival(A_fcn, x0)  # (*, 1, nc)
-        negeival = largest_eival <= 0
-
-        # if the largest eigenvalue is negative, then it's not posdef
-        if torch.all(negeival):
-            posdef = False
-
-        # otherwise, calculate the lowest eigenvalue to check if it's positive
-        else:
-            offset = torch.clamp(largest_eival, min=0.0)
-            A_fcn2 = lambda x: A_fcn(x) - offset * x
-            mostneg_eival = _get_largest_eival(A_fcn2, x0)  # (*, 1, nc)
-            posdef = bool(torch.all(torch.logical_or(-mostneg_eival <= offset, negeival)).item())
-
-    # get the linear operation if it is not a posdef (A -> AT.A)
-    if posdef:
-        return A_fcn, AT_fcn, B_new, col_swapped
-    else:
-        def A_new_fcn(x):
-            return AT_fcn(A_fcn(x))
-        B2 = AT_fcn(B_new)
-        return A_new_fcn, A_new_fcn, B2, col_swapped
-
-def _get_largest_eival(Afcn, x):
-    niter = 10
-    rtol = 1e-3
-    atol = 1e-6
-    xnorm_prev = None
-    for i in range(niter):
-        x = Afcn(x)  # (*, nr, nc)
-        xnorm = x.norm(dim=-2, keepdim=True)  # (*, 1, nc)
-
-        # check if xnorm is converging
-        if i > 0:
-            dnorm = torch.abs(xnorm_prev - xnorm)
-            if torch.all(dnorm <= rtol * xnorm + atol):
-                break
-
-        xnorm_prev = xnorm
-        if i < niter - 1:
-            x = x / xnorm
-    return xnorm
+import warnings
+import weakref
+import inspect
+import functools
+from typing import Union, Optional, Callable, Tuple, Sequence
+import torch
+import numpy as np
+from xitorch import LinearOperator
+from xitorch._core.linop import MatrixLinearOperator
+from scipy.sparse.linalg import gmres as scipy_gmres
+from scipy.sparse.linalg import cg as scipy_cg
+from xitorch._impls.optimize.root.rootsolver import broyden1
+from xitorch._utils.bcast import normalize_bcast_dims, get_bcasted_dims
+from xitorch._utils.exceptions import ConvergenceWarning
+from xitorch._utils.types import get_np_dtype
+
+__all__ = ["wrap_gmres", "wrap_cg", "cg", "blockcg", "minres", "bicgstab", "broyden1_solve", "exactsolve",
+           "gmres"]
+
+# scipy renamed the relative-tolerance argument of the iterative solvers from
+# tol to rtol in 1.12 (and removed tol in 1.14)
+_scipy_tol_kwarg = "rtol" if "rtol" in inspect.signature(scipy_cg).parameters else "tol"
+
+try:
+    # converting a tensor to a Python value is not allowed on the tensors
+    # wrapped by the functorch transforms (e.g. inside torch.vmap), so the
+    # data-dependent short-circuits must be skipped on them
+    from torch._C._functorch import is_batchedtensor as _is_batchedtensor
+except ImportError:  # torch < 1.13
+    try:
+        from functorch._C import is_batchedtensor as _is_batchedtensor  # type: ignore
+    except ImportError:
+        def _is_batchedtensor(x: torch.Tensor) -> bool:
+            return False
+
+def wrap_gmres(A, B, E=None, M=None,
+               min_eps=1e-9,
+               max_niter=None,
+               **unused):
+    """
+    Using SciPy's gmres method to solve the linear equation.
+
+    Keyword arguments
+    -----------------
+    min_eps: float
+        Relative tolerance for stopping conditions
+    max_niter: int or None
+        Maximum number of iterations. If ``None``, default to twice of the
+        number of columns of ``A``.
+    """
+    # A: (*BA, nr, nr)
+    # B: (*BB, nr, ncols)
+    # E: (*BE, ncols) or None
+    # M: (*BM, nr, nr) or None
+
+    # NOTE: currently only works for batched B (1 batch dim), but unbatched A
+    assert len(A.shape) == 2 and len(B.shape) == 3, "Currently only works for batched B (1 batch dim), but unbatched A"
+    assert not torch.is_complex(B), "complex is not supported in gmres"
+
+    # check the parameters
+    msg = "GMRES can only do AX=B"
+    assert A.shape[-2] == A.shape[-1], "GMRES can only work for square operator for now"
+    assert E is None, msg
+    assert M is None, msg
+
+    nbatch, na, ncols = B.shape
+    if max_niter is None:
+        max_niter = 2 * na
+
+    B = B.transpose(-1, -2)  # (nbatch, ncols, na)
+
+    # convert the numpy/scipy
+    op = A.scipy_linalg_op()
+    B_np = B.detach().cpu().numpy()
+    res_np = np.empty(B.shape, dtype=get_np_dtype(B.dtype))
+    for i in range(nbatch):
+        for j in range(ncols):
+            x, info = scipy_gmres(op, B_np[i, j, :], atol=1e-12, maxiter=max_niter,
+                                  **{_scipy_tol_kwarg: min_eps})
+            if info > 0:
+                msg = "The GMRES iteration does not converge to the desired value "\
+                      "(%.3e) after %d iterations" % \
+                      (min_eps, info)
+                warnings.warn(ConvergenceWarning(msg))
+            res_np[i, j, :] = x
+
+    res = torch.tensor(res_np, dtype=B.dtype, device=B.device)
+    res = res.transpose(-1, -2)  # (nbatch, na, ncols)
+    return res
+
+def wrap_cg(A, B, E=None, M=None,
+            min_eps=1e-9,
+            max_niter=None,
+            **unused):
+    """
+    Using SciPy's conjugate gradient method to solve the linear equation.
+    As the iteration runs in compiled SciPy code, this can be faster than
+    :func:`cg` for small problems on CPU where the per-iteration PyTorch
+    dispatch overhead dominates over the actual operations.
+
+    Keyword arguments
+    -----------------
+    min_eps: float
+        Relative tolerance for stopping conditions
+    max_niter: int or None
+        Maximum number of iterations. If ``None``, default to twice of the
+        number of columns of ``A``.
+    """
+    # A: (*BA, nr, nr)
+    # B: (*BB, nr, ncols)
+    # E: (*BE, ncols) or None
+    # M: (*BM, nr, nr) or None
+
+    # NOTE: currently only works for batched B (1 batch dim), but unbatched A
+    assert len(A.shape) == 2 and len(B.shape) == 3, "Currently only works for batched B (1 batch dim), but unbatched A"
+
+    # check the parameters
+    msg = "CG can only do AX=B"
+    assert A.shape[-2] == A.shape[-1], "CG can only work for square operator for now"
+    assert E is None, msg
+    assert M is None, msg
+
+    nbatch, na, ncols = B.shape
+    if max_niter is None:
+        max_niter = 2 * na
+
+    B = B.transpose(-1, -2)  # (nbatch, ncols, na)
+
+    # convert the numpy/scipy
+    op = A.scipy_linalg_op()
+    B_np = B.detach().cpu().numpy()
+    res_np = np.empty(B.shape, dtype=get_np_dtype(B.dtype))
+    for i in range(nbatch):
+        for j in range(ncols):
+            x, info = scipy_cg(op, B_np[i, j, :], atol=1e-12, maxiter=max_niter,
+                               **{_scipy_tol_kwarg: min_eps})
+            if info > 0:
+                msg = "The CG iteration does not converge to the desired value "\
+                      "(%.3e) after %d iterations" % \
+                      (min_eps, info)
+                warnings.warn(ConvergenceWarning(msg))
+            res_np[i, j, :] = x
+
+    res = torch.tensor(res_np, dtype=B.dtype, device=B.device)
+    res = res.transpose(-1, -2)  # (nbatch, na, ncols)
+    return res
+
+def cg(A: LinearOperator, B: torch.Tensor,
+        E: Optional[torch.Tensor] = None,
+        M: Optional[LinearOperator] = None,
+        posdef: Optional[bool] = None,
+        precond: Optional[LinearOperator] = None,
+        max_niter: Optional[int] = None,
+        rtol: float = 1e-6,
+        atol: float = 1e-8,
+        eps: float = 1e-12,
+        resid_calc_every: int = 10,
+        check_every: int = 1,
+        restart: int = 0,
+        beta_method: str = "fr",
+        verbose: bool = False,
+        fuse_update: bool = False,
+        mixed_precision: bool = False,
+        cache_setup: bool = False,
+        **unused) -> torch.Tensor:
+    r"""
+    Solve the linear equations using Conjugate-Gradient (CG) method.
+
+    Keyword arguments
+    -----------------
+    posdef: bool or None
+        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
+        definite for all columns and batches.
+        If None, it will be determined by power iterations.
+    precond: LinearOperator or None
+        LinearOperator for the preconditioning. If None, no preconditioner is
+        applied.
+    max_niter: int or None
+        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
+    rtol: float
+        Relative tolerance for stopping condition w.r.t. norm of B
+    atol: float
+        Absolute tolerance for stopping condition w.r.t. norm of B
+    eps: float
+        Substitute the absolute zero in the algorithm's denominator with this
+        value to avoid nan.
+    resid_calc_every: int
+        Calculate the residual in its actual form instead of substitution form
+        with this frequency, to avoid rounding error accummulation.
+        If your linear operator has bad numerical precision, set this to be low.
+        If 0, then never calculate the residual in its actual form.
+    check_every: int
+        Check the stopping condition (which requires a device-to-host
+        synchronization) with this frequency. Setting it above 1 amortizes
+        the synchronization cost over several iterations at the price of
+        possibly performing a few extra iterations after convergence.
+        If 0, then always run the full ``max_niter`` iterations without any
+        synchronization nor data-dependent control flow (e.g. for
+        ``torch.vmap`` or a CUDA-graph capture), taking the last iterate
+        without any convergence check nor warning.
+    restart: int
+        Reset the conjugate direction to the preconditioned residual with this
+        frequency to clear the accumulated rounding errors.
+        If 0 (default), then never restart.
+    beta_method: str
+        The formula of the update coefficient :math:`\beta`:
+        ``"fr"`` for Fletcher-Reeves or ``"pr"`` for the non-negative
+        Polak-Ribiere, which implicitly restarts the direction when the
+        iterations stagnate.
+    verbose: bool
+        Verbosity of the algorithm.
+    fuse_update: bool
+        If True, fuse the pointwise operations of the CG update into single
+        kernels with ``torch.compile`` to reduce the memory traffic and the
+        kernel launch overheads. It requires PyTorch 2.0 or above and incurs a
+        compilation cost at the first iteration.
+    mixed_precision: bool
+        If True, run the iteration in a lower precision (e.g. float32 for a
+        float64 problem) to halve the memory traffic of the bandwidth-bound
+        updates, while recomputing the residual in the original precision with
+        the ``resid_calc_every`` frequency to refine the accummulated rounding
+        errors. The tolerances then might not be achievable if they are below
+        the lower precision's resolution.
+    cache_setup: bool
+        If True, cache the constructed matvec closures and the posdef
+        determination across the calls that use the same operators (e.g. the
+        forward solve and the adjoint solve in every backward pass). The
+        cached entries are invalidated by in-place parameter updates, but
+        they keep the tensors captured by the closures alive until evicted,
+        so only enable this when solving repeatedly with the same operators.
+    """
+    nr = A.shape[-1]
+    ncols = B.shape[-1]
+    if max_niter is None:
+        max_niter = int(1.5 * nr)
+
+    # if B is all zeros, then return zeros
+    # (equivalent to allclose(B, B * 0), but with a single reduction and no
+    # temporary tensor; skipped under the functorch transforms, where the
+    # data-dependent branch is not allowed)
+    batchdims = _get_batchdims(A, B, E, M)
+    if not _is_batchedtensor(B) and B.abs().amax() <= atol:
+        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
+        return x0
+
+    # setup the preconditioning and the matrix problem
+    precond_fcn = _setup_precond(precond)
+    need_hermit = True
+    A_fcn, _, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
+                                                      posdef, need_hermit,
+                                                      use_cache=cache_setup)
+
+    # under the functorch transforms (e.g. inside torch.vmap) the in-place
+    # buffer machinery below cannot be used, because writing batched values
+    # into the preallocated unbatched buffers is not allowed: run a
+    # fixed-iteration out-of-place variant instead (as with check_every=0,
+    # the last iterate is taken without a convergence check)
+    if _is_batchedtensor(B2):
+        xk = _cg_outofplace(A_fcn, precond_fcn, B2, max_niter, eps)
+        xk = xk.to(A.dtype)
+        if col_swapped:
+            # x: (ncols, *, nr, 1)
+            xk = xk.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
+        return xk
+
+    # get the stopping matrix
+    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
+    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
+
+    # prepare the initial guess (it's just all zeros), keeping the iterate and
+    # the residual in one contiguous block so the pointwise updates read and
+    # write a single strided buffer.
+    # the operator and preconditioner outputs (Apk, zk) are freshly allocated
+    # by their ops, so packing them as well would only add a copy per iteration.
+    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
+    iter_dtype = _get_lower_dtype(A.dtype) if mixed_precision else A.dtype
+    state = torch.zeros((3, *x0shape), dtype=iter_dtype, device=A.device)
+    xk = state[0]  # (*, nr, nc)
+    rk = state[1]  # (*, nr, nc)
+    pk = state[2]  # (*, nr, nc)
+
+    # in the mixed-precision mode, only the iterates and the pointwise updates
+    # run in the lower precision: the matvec is still applied in the original
+    # precision, and so is the regular residual recalculation below, which then
+    # acts as an iterative refinement of the lower precision iteration
+    A_hi_fcn = A_fcn
+    if iter_dtype != A.dtype:
+        A_fcn = lambda x: A_hi_fcn(x.to(B2.dtype)).to(iter_dtype)
+        if precond_fcn is not None:
+            precond_hi_fcn = precond_fcn
+            precond_fcn = lambda x: precond_hi_fcn(x.to(B2.dtype)).to(iter_dtype)
+
+    def calc_resid(xk, rk):
+        # recompute the residual in its actual form (in the original precision)
+        if iter_dtype == B2.dtype:
+            torch.sub(B2, A_hi_fcn(xk), out=rk)
+        else:
+            rk.copy_(B2 - A_hi_fcn(xk.to(B2.dtype)))
+
+    # get the (optionally fused) pointwise update functions
+    xr_update, p_update = _get_cg_updates(fuse_update, beta_method)
+
+    # preallocate the workspace of the pointwise updates, so the iteration
+    # runs on a fixed memory footprint (no per-iteration allocation outside
+    # the operator and preconditioner applications), which also makes the
+    # check_every=0 loop capturable in a CUDA graph
+    tmp = torch.empty_like(rk)  # (*, nr, nc)
+    rk_old = torch.empty_like(rk) if beta_method == "pr" else rk
+
+    calc_resid(xk, rk)  # (*, nr, nc)
+    zk = precond_fcn(rk) if precond_fcn is not None else rk  # (*, nr, nc)
+    pk.copy_(zk)
+    rkzk = _dot(rk, zk)
+    # mask of the columns that have not converged yet, so the converged ones
+    # are frozen instead of stopping all the columns at the worst one
+    active = torch.ones_like(stop_matrix, dtype=torch.bool)  # (*, 1, nc)
+    converge = False
+    if check_every != 0:
+        best_resid = rk.norm(dim=-2).max().item()
+        best_xk = xk.clone()  # the (only) allocation of the snapshot buffer
+    for k in range(1, max_niter + 1):
+        Apk = A_fcn(pk)
+        # the Polak-Ribiere update needs the residual before the update
+        if beta_method == "pr":
+            rk_old.copy_(rk)
+        xr_update(rkzk, pk, Apk, xk, rk, eps, active, tmp)  # updates xk & rk in-place
+
+        # correct the residual calculation
+        restart_now = restart != 0 and k % restart == 0
+        if restart_now or (resid_calc_every != 0 and k % resid_calc_every == 0):
+            calc_resid(xk, rk)
+
+        # update the mask of the unconverged columns (on device, no sync)
+        resid_norm = rk.norm(dim=-2, keepdim=True)
+        active = active & (resid_norm >= stop_matrix)
+
+        if verbose:
+            if k < 10 or k % 10 == 0:
+                print("%4d: |dy|=%.3e" % (k, resid_norm))
+
+        # check for the stopping condition (this part synchronizes, so it is
+        # only done with check_every frequency)
+        if check_every != 0 and (k % check_every == 0 or k == max_niter):
+            max_resid_norm = resid_norm.max().item()
+            if max_resid_norm < best_resid:
+                best_resid = max_resid_norm
+                best_xk.copy_(xk)
+
+            if not bool(active.any()):
+                converge = True
+                break
+
+        zk = precond_fcn(rk) if precond_fcn is not None else rk
+        if restart_now:
+            # discard the accumulated direction
+            pk.copy_(zk)
+            rkzk = _dot(rk, zk)
+        else:
+            rkzk = p_update(rk, zk, rk_old, rkzk, pk, eps, tmp)  # updates pk in-place
+
+    if check_every == 0:
+        # the loop above ran a fixed number of iterations without any host
+        # synchronization nor data-dependent control flow, so the last iterate
+        # is taken without a convergence check (which would synchronize)
+        converge = True
+        best_xk = xk
+    xk = best_xk.to(A.dtype)
+    if not converge:
+        msg = ("Convergence is not achieved after %d iterations. "
+               "Max norm of best resid: %.3e") % (max_niter, best_resid)
+        warnings.warn(ConvergenceWarning(msg))
+    if col_swapped:
+        # x: (ncols, *, nr, 1)
+        xk = xk.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
+    return xk
+
+def blockcg(A: LinearOperator, B: torch.Tensor,
+            E: Optional[torch.Tensor] = None,
+            M: Optional[LinearOperator] = None,
+            posdef: Optional[bool] = None,
+            precond: Optional[LinearOperator] = None,
+            max_niter: Optional[int] = None,
+            rtol: float = 1e-6,
+            atol: float = 1e-8,
+            eps: float = 1e-12,
+            resid_calc_every: int = 10,
+            verbose: bool = False,
+            **unused) -> torch.Tensor:
+    r"""
+    Solve the linear equations using the block Conjugate-Gradient method.
+    All the columns of :math:`\mathbf{B}` share one block-Krylov basis and the
+    step sizes are small ``(ncols, ncols)`` matrices instead of per-column
+    scalars, so the iteration count typically drops with the number of columns
+    at the cost of small dense solves per iteration.
+    It is advantageous over ``cg`` for multiple right-hand-sides with a few
+    dozen columns or less.
+
+    Keyword arguments
+    -----------------
+    posdef: bool or None
+        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
+        definite for all columns and batches.
+        If None, it will be determined by power iterations.
+    precond: LinearOperator or None
+        LinearOperator for the preconditioning. If None, no preconditioner is
+        applied.
+    max_niter: int or None
+        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
+    rtol: float
+        Relative tolerance for stopping condition w.r.t. norm of B
+    atol: float
+        Absolute tolerance for stopping condition w.r.t. norm of B
+    eps: float
+        Regularizer of the small dense solves (added to the diagonal of the
+        Gram matrices) to avoid breakdown on rank-deficient blocks.
+    resid_calc_every: int
+        Calculate the residual in its actual form instead of substitution form
+        with this frequency, to avoid rounding error accummulation.
+        If your linear operator has bad numerical precision, set this to be low.
+        If 0, then never calculate the residual in its actual form.
+    verbose: bool
+        Verbosity of the algorithm.
+    """
+    nr = A.shape[-1]
+    ncols = B.shape[-1]
+    if max_niter is None:
+        max_niter = int(1.5 * nr)
+
+    # if B is all zeros, then return zeros
+    batchdims = _get_batchdims(A, B, E, M)
+    if B.abs().amax() <= atol:
+        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
+        return x0
+
+    # setup the preconditioning and the matrix problem
+    precond_fcn = _setup_precond(precond)
+    need_hermit = True
+    A_fcn, _, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
+                                                      posdef, need_hermit)
+
+    # get the stopping matrix
+    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
+    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
+
+    # prepare the initial guess (it's just all zeros)
+    # NOTE: in the col_swapped case each swapped problem has a single column,
+    # so the block iteration degenerates into the ordinary CG
+    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
+    xk = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
+
+    rk = B2 - A_fcn(xk)  # (*, nr, nc)
+    zk = precond_fcn(rk) if precond_fcn is not None else rk  # (*, nr, nc)
+    pk = zk.clone()  # (*, nr, nc)
+    converge = False
+    best_resid = rk.norm(dim=-2).max().item()
+    best_xk = xk
+    for k in range(1, max_niter + 1):
+        Apk = A_fcn(pk)
+        pApk = _gram(pk, Apk)  # (*, nc, nc)
+        alphak = _solve_gram(pApk, _gram(pk, rk), eps)  # (*, nc, nc)
+        xk = xk + torch.matmul(pk, alphak)
+
+        # correct the residual calculation
+        if resid_calc_every != 0 and k % resid_calc_every == 0:
+            rk = B2 - A_fcn(xk)
+        else:
+            rk = rk - torch.matmul(Apk, alphak)  # (*, nr, nc)
+
+        # check for the stopping condition
+        resid_norm = rk.norm(dim=-2, keepdim=True)  # (*, 1, nc)
+
+        max_resid_norm = resid_norm.max().item()
+        if max_resid_norm < best_resid:
+            best_resid = max_resid_norm
+            best_xk = xk
+
+        if verbose:
+            if k < 10 or k % 10 == 0:
+                print("%4d: |dy|=%.3e" % (k, max_resid_norm))
+
+        if torch.all(resid_norm < stop_matrix):
+            converge = True
+            break
+
+        # conjugate the new direction directly against the previous block
+        # (O'Leary's formulation, which is more robust to rounding than the
+        # Fletcher-Reeves-like ratio of the residual Gram matrices)
+        zk = precond_fcn(rk) if precond_fcn is not None else rk
+        betak = -_solve_gram(pApk, _gram(Apk, zk), eps)  # (*, nc, nc)
+        pk = zk + torch.matmul(pk, betak)
+
+    xk = best_xk
+    if not converge:
+        msg = ("Convergence is not achieved after %d iterations. "
+               "Max norm of best resid: %.3e") % (max_niter, best_resid)
+        warnings.warn(ConvergenceWarning(msg))
+    if col_swapped:
+        # x: (ncols, *, nr, 1)
+        xk = xk.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
+    return xk
+
+def minres(A: LinearOperator, B: torch.Tensor,
+           E: Optional[torch.Tensor] = None,
+           M: Optional[LinearOperator] = None,
+           max_niter: Optional[int] = None,
+           rtol: float = 1e-6,
+           atol: float = 1e-8,
+           eps: float = 1e-12,
+           verbose: bool = False,
+           **unused) -> torch.Tensor:
+    r"""
+    Solve the linear equations using Minimum Residual (MINRES) method.
+    As it only requires the operation :math:`\mathbf{AX-MXE}` to be Hermitian
+    (not necessarily positive definite), it avoids squaring the condition
+    number and the double operator application that CG performs on indefinite
+    systems.
+
+    Keyword arguments
+    -----------------
+    max_niter: int or None
+        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
+    rtol: float
+        Relative tolerance for stopping condition w.r.t. norm of B
+    atol: float
+        Absolute tolerance for stopping condition w.r.t. norm of B
+    eps: float
+        Substitute the absolute zero in the algorithm's denominator with this
+        value to avoid nan.
+    verbose: bool
+        Verbosity of the algorithm.
+    """
+    nr = A.shape[-1]
+    ncols = B.shape[-1]
+    if max_niter is None:
+        max_niter = int(1.5 * nr)
+
+    # if B is all zeros, then return zeros
+    # (equivalent to allclose(B, B * 0), but with a single reduction and no
+    # temporary tensor)
+    batchdims = _get_batchdims(A, B, E, M)
+    if B.abs().amax() <= atol:
+        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
+        return x0
+
+    # setup the matrix problem without squaring the operator (MINRES does not
+    # require positive definiteness, only Hermiticity, so posdef is set to
+    # True to avoid the AT*A transformation unless A is not Hermitian)
+    need_hermit = True
+    A_fcn, _, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
+                                                      True, need_hermit)
+
+    # get the stopping matrix
+    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
+    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
+
+    # prepare the initial guess (it's just all zeros)
+    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
+    xk = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
+
+    # Lanczos and Givens rotation variables (following Paige & Saunders), where
+    # the "scalars" are kept as (*, 1, nc) tensors so every column and batch
+    # runs its own recurrence
+    r1 = B2 - A_fcn(xk)
+    y = r1
+    beta = r1.norm(dim=-2, keepdim=True)  # (*, 1, nc)
+    oldb = torch.zeros_like(beta)
+    dbar = torch.zeros_like(beta)
+    epsln = torch.zeros_like(beta)
+    phibar = beta
+    cs = -torch.ones_like(beta)
+    sn = torch.zeros_like(beta)
+    w = torch.zeros_like(r1)
+    w2 = torch.zeros_like(r1)
+    r2 = r1
+
+    converge = False
+    best_resid = beta.max().item()
+    best_xk = xk
+    for k in range(1, max_niter + 1):
+        v = y / _safedenom(beta, eps)
+        y = A_fcn(v)
+        if k >= 2:
+            y = y - (beta / _safedenom(oldb, eps)) * r1
+        alfa = _dot(v, y)
+        # for a Hermitian operator, the Lanczos scalars are real
+        if torch.is_complex(alfa):
+            alfa = alfa.real
+        y = y - (alfa / _safedenom(beta, eps)) * r2
+        r1 = r2
+        r2 = y
+        oldb = beta
+        beta = r2.norm(dim=-2, keepdim=True)
+
+        # apply the previous rotation
+        oldeps = epsln
+        delta = cs * dbar + sn * alfa
+        gbar = sn * dbar - cs * alfa
+        epsln = sn * beta
+        dbar = -cs * beta
+
+        # compute the next rotation
+        gamma = torch.sqrt(gbar * gbar + beta * beta)
+        gamma = torch.clamp(gamma, min=eps)
+        cs = gbar / gamma
+        sn = beta / gamma
+        phi = cs * phibar
+        phibar = sn * phibar
+
+        # update the solution
+        w1 = w2
+        w2 = w
+        w = (v - oldeps * w1 - delta * w2) / gamma
+        xk = xk + phi * w
+
+        # phibar is the norm of the residual of the k-th iterate
+        resid_norm = phibar  # (*, 1, nc)
+
+        max_resid_norm = resid_norm.max().item()
+        if max_resid_norm < best_resid:
+            best_resid = max_resid_norm
+            best_xk = xk
+
+        if verbose:
+            if k < 10 or k % 10 == 0:
+                print("%4d: |dy|=%.3e" % (k, max_resid_norm))
+
+        # check for the stopping condition
+        if torch.all(resid_norm < stop_matrix):
+            converge = True
+            break
+
+    xk = best_xk
+    if not converge:
+        msg = ("Convergence is not achieved after %d iterations. "
+               "Max norm of best resid: %.3e") % (max_niter, best_resid)
+        warnings.warn(ConvergenceWarning(msg))
+    if col_swapped:
+        # x: (ncols, *, nr, 1)
+        xk = xk.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
+    return xk
+
+def bicgstab(A: LinearOperator, B: torch.Tensor,
+             E: Optional[torch.Tensor] = None,
+             M: Optional[LinearOperator] = None,
+             posdef: Optional[bool] = None,
+             precond_l: Optional[LinearOperator] = None,
+             precond_r: Optional[LinearOperator] = None,
+             max_niter: Optional[int] = None,
+             rtol: float = 1e-6,
+             atol: float = 1e-8,
+             eps: float = 1e-12,
+             verbose: bool = False,
+             resid_calc_every: int = 10,
+             **unused) -> torch.Tensor:
+    r"""
+    Solve the linear equations using stabilized Biconjugate-Gradient method.
+
+    Keyword arguments
+    -----------------
+    posdef: bool or None
+        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
+        definite for all columns and batches.
+        If None, it will be determined by power iterations.
+    precond_l: LinearOperator or None
+        LinearOperator for the left preconditioning. If None, no
+        preconditioner is applied.
+    precond_r: LinearOperator or None
+        LinearOperator for the right preconditioning. If None, no
+        preconditioner is applied.
+    max_niter: int or None
+        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
+    rtol: float
+        Relative tolerance for stopping condition w.r.t. norm of B
+    atol: float
+        Absolute tolerance for stopping condition w.r.t. norm of B
+    eps: float
+        Substitute the absolute zero in the algorithm's denominator with this
+        value to avoid nan.
+    resid_calc_every: int
+        Calculate the residual in its actual form instead of substitution form
+        with this frequency, to avoid rounding error accummulation.
+        If your linear operator has bad numerical precision, set this to be low.
+        If 0, then never calculate the residual in its actual form.
+    verbose: bool
+        Verbosity of the algorithm.
+    """
+    nr, ncols = B.shape[-2:]
+    if max_niter is None:
+        max_niter = int(1.5 * nr)
+
+    # if B is all zeros, then return zeros
+    # (equivalent to allclose(B, B * 0), but with a single reduction and no
+    # temporary tensor)
+    batchdims = _get_batchdims(A, B, E, M)
+    if B.abs().amax() <= atol:
+        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
+        return x0
+
+    # setup the preconditioning and the matrix problem
+    precond_fcn_l = _setup_precond(precond_l)
+    precond_fcn_r = _setup_precond(precond_r)
+    need_hermit = False
+    A_fcn, AT_fcn, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
+                                                           posdef, need_hermit)
+
+    # get the stopping matrix
+    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
+    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
+
+    # prepare the initial guess (it's just all zeros)
+    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
+    xk = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
+
+    rk = B2 - A_fcn(xk)
+    r0hat = rk
+    rho_k = _dot(r0hat, rk)
+    omega_k = torch.tensor(1.0, dtype=A.dtype, device=A.device)
+    alpha: Union[float, torch.Tensor] = 1.0
+    vk: Union[float, torch.Tensor] = 0.0
+    pk: Union[float, torch.Tensor] = 0.0
+    converge = False
+    best_resid = rk.norm(dim=-2).max()
+    best_xk = xk
+    for k in range(1, max_niter + 1):
+        rho_knew = _dot(r0hat, rk)
+        omega_denom = _safedenom(omega_k, eps)
+        beta = rho_knew / _safedenom(rho_k, eps) * (alpha / omega_denom)
+        pk = rk + beta * (pk - omega_k * vk)
+        y = precond_fcn_r(pk) if precond_fcn_r is not None else pk
+        vk = A_fcn(y)
+        alpha = rho_knew / _safedenom(_dot(r0hat, vk), eps)
+        h = xk + alpha * y
+
+        s = rk - alpha * vk
+        z = precond_fcn_r(s) if precond_fcn_r is not None else s
+        t = A_fcn(z)
+        if precond_fcn_l is not None:
+            Kt = precond_fcn_l(t)
+            Ks = precond_fcn_l(s)
+        else:
+            Kt = t
+            Ks = s
+        omega_k = _dot(Kt, Ks) / _safedenom(_dot(Kt, Kt), eps)
+        xk = h + omega_k * z
+
+        # correct the residual calculation regularly
+        if resid_calc_every != 0 and k % resid_calc_every == 0:
+            rk = B2 - A_fcn(xk)
+        else:
+            rk = s - omega_k * t
+
+        # calculate the residual
+        resid = rk
+        resid_norm = resid.norm(dim=-2, keepdim=True)
+
+        # save the best results
+        max_resid_norm = resid_norm.max().item()
+        if max_resid_norm < best_resid:
+            best_resid = max_resid_norm
+            best_xk = xk
+
+        if verbose:
+            if k < 10 or k % 10 == 0:
+                print("%4d: |dy|=%.3e" % (k, resid_norm))
+
+        # check for the stopping conditions
+        if torch.all(resid_norm < stop_matrix):
+            converge = True
+            break
+
+        rho_k = rho_knew
+
+    xk = best_xk
+    if not converge:
+        msg = ("Convergence is not achieved after %d iterations. "
+               "Max norm of resid: %.3e") % (max_niter, best_resid)
+        warnings.warn(ConvergenceWarning(msg))
+    if col_swapped:
+        # x: (ncols, *, nr, 1)
+        xk = xk.transpose(0, -1).squeeze(0)  # (*, nr, ncols)
+    return xk
+
+def gmres(A: LinearOperator, B: torch.Tensor,
+          E: Optional[torch.Tensor] = None,
+          M: Optional[LinearOperator] = None,
+          posdef: Optional[bool] = None,
+          max_niter: Optional[int] = None,
+          rtol: float = 1e-6,
+          atol: float = 1e-8,
+          eps: float = 1e-12,
+          **unused) -> torch.Tensor:
+    r"""
+    Solve the linear equations using Generalised minial residual method.
+
+    Keyword arguments
+    -----------------
+    posdef: bool or None
+        Indicating if the operation :math:`\mathbf{AX-MXE}` a positive
+        definite for all columns and batches.
+        If None, it will be determined by power iterations.
+    max_niter: int or None
+        Maximum number of iteration. If None, it is set to ``int(1.5 * A.shape[-1])``
+    rtol: float
+        Relative tolerance for stopping condition w.r.t. norm of B
+    atol: float
+        Absolute tolerance for stopping condition w.r.t. norm of B
+    eps: float
+        Substitute the absolute zero in the algorithm's denominator with this
+        value to avoid nan.
+    """
+    converge = False
+
+    nr, ncols = A.shape[-1], B.shape[-1]
+    if max_niter is None:
+        max_niter = int(nr)
+
+    # if B is all zeros, then return zeros
+    # (equivalent to allclose(B, B * 0), but with a single reduction and no
+    # temporary tensor)
+    batchdims = _get_batchdims(A, B, E, M)
+    if B.abs().amax() <= atol:
+        x0 = torch.zeros((*batchdims, nr, ncols), dtype=A.dtype, device=A.device)
+        return x0
+
+    # setup the preconditioning and the matrix problem
+    need_hermit = False
+    A_fcn, AT_fcn, B2, col_swapped = _setup_linear_problem(A, B, E, M, batchdims,
+                                                           posdef, need_hermit)
+
+    # get the stopping matrix
+    B_norm = B2.norm(dim=-2, keepdim=True)  # (*BB, 1, nc)
+    stop_matrix = torch.max(rtol * B_norm, atol * torch.ones_like(B_norm))  # (*BB, 1, nc)
+
+    # prepare the initial guess (it's just all zeros)
+    x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
+    x0 = torch.zeros(x0shape, dtype=A.dtype, device=A.device)
+
+    r = B2 - A_fcn(x0)  # torch.Size([*batch_dims, nr, ncols])
+    best_resid = r.norm(dim=-2, keepdim=True)  # / B_norm
+
+    best_resid = best_resid.max().item()
+    best_res = x0
+    q = torch.empty([max_niter] + list(r.shape), dtype=A.dtype, device=A.device)
+    q[0] = r / _safedenom(r.norm(dim=-2, keepdim=True), eps)  # torch.Size([*batch_dims, nr, ncols])
+    h = torch.zeros((*batchdims, ncols, max_niter + 1, max_niter), dtype=A.dtype, device=A.device)
+    h = h.reshape((-1, ncols, max_niter + 1, max_niter))
+
+    for k in range(min(nr, max_niter)):
+        y = A_fcn(q[k])  # torch.Size([*batch_dims, nr, ncols])
+        for j in range(k + 1):
+            h[..., j, k] = _dot(q[j], y).reshape(-1, ncols)
+            y = y - h[..., j, k].reshape(*batchdims, 1, ncols) * q[j]
+
+        h[..., k + 1, k] = torch.linalg.norm(y, dim=-2)
+        if torch.any(h[..., k + 1, k]) != 0 and k != max_niter - 1:
+            q[k + 1] = y.reshape(-1, nr, ncols) / h[..., k + 1, k].reshape(-1, 1, ncols)
+            q[k + 1] = q[k + 1].reshape(*batchdims, nr, ncols)
+
+        b = torch.zeros((*batchdims, ncols, k + 1), dtype=A.dtype, device=A.device)
+        b = b.reshape(-1, ncols, k + 1)
+        b[..., 0] = torch.linalg.norm(r, dim=-2)
+        rk = torch.linalg.lstsq(h[..., :k + 1, :k], b)[0]  # torch.Size([*batch_dims, max_niter])
+        # Q, R = torch.linalg.qr(h[:, :k+1, :k], mode='complete')
+        # result = torch.triangular_solve(torch.matmul(Q.permute(0, 2, 1), b[:, :, None])[:, :-1], R[:, :-1, :])[0]
+
+        res = torch.empty([])
+        for i in range(k):
+            res = res + q[i] * rk[..., i].reshape(*batchdims, 1, ncols) + x0 if res.size() \
+                else q[i] * rk[..., i].reshape(*batchdims, 1, ncols) + x0
+            # res = res * B_norm
+
+        if res.size():
+            resid = B2 - A_fcn(res)
+            resid_norm = resid.norm(dim=-2, keepdim=True)
+
+            # save the best results
+            max_resid_norm = resid_norm.max().item()
+            if max_resid_norm < best_resid:
+                best_resid = max_resid_norm
+                best_res = res
+
+            if torch.all(resid_norm < stop_matrix):
+                converge = True
+                break
+
+    if not converge:
+        msg = ("Convergence is not achieved after %d iterations. "
+               "Max norm of resid: %.3e") % (max_niter, best_resid)
+        warnings.warn(ConvergenceWarning(msg))
+
+    res = best_res
+    return res
+
+
+############ cg and bicgstab helpers ############
+# the next lower precision to run the iterates in for the mixed-precision mode
+# (dtypes without a lower counterpart fall back to themselves, i.e. no-op)
+_lower_dtypes = {
+    torch.float64: torch.float32,
+    torch.float32: torch.bfloat16,
+    torch.complex128: torch.complex64,
+}
+
+def _get_lower_dtype(dtype: torch.dtype) -> torch.dtype:
+    return _lower_dtypes.get(dtype, dtype)
+
+def _safedenom(r: torch.Tensor, eps: float) -> torch.Tensor:
+    # substitute the zero elements with eps in a branchless way, so it compiles
+    # to a single elementwise kernel without mutating nor copying the input
+    # (the fill is a broadcast 0-dim tensor, not a full-size temporary)
+    return torch.where(r == 0, r.new_full((), eps), r)
+
+def _dot(r: torch.Tensor, z: torch.Tensor) -> torch.Tensor:
+    # r: (*BR, nr, nc)
+    # z: (*BR, nr, nc)
+    # return: (*BR, 1, nc)
+    # NOTE: the mul+sum form avoids the einsum dispatch overhead and, inside a
+    # torch.compile region, gets fused with the neighbouring elementwise kernels
+    return (r.conj() * z).sum(dim=-2, keepdim=True)
+
+def _gram(r: torch.Tensor, z: torch.Tensor) -> torch.Tensor:
+    # the block generalization of _dot: the Gram matrix between the columns
+    # r: (*BR, nr, nc)
+    # z: (*BR, nr, nc)
+    # return: (*BR, nc, nc)
+    return torch.matmul(r.conj().transpose(-2, -1), z)
+
+def _solve_gram(gram_mat: torch.Tensor, bmat: torch.Tensor, eps: float) -> torch.Tensor:
+    # solve the small (nc, nc) Gram system with a diagonal regularizer scaled
+    # relative to the magnitude of the Gram matrix, to avoid breakdown when
+    # some of the block columns are (nearly) converged or linearly dependent
+    nc = gram_mat.shape[-1]
+    diag = gram_mat.diagonal(dim1=-2, dim2=-1).abs().amax(dim=-1)  # (*,)
+    scale = (eps * diag + eps * eps)[..., None, None]  # (*, 1, 1)
+    eye = torch.eye(nc, dtype=gram_mat.dtype, device=gram_mat.device)
+    return torch.linalg.solve(gram_mat + scale * eye, bmat)
+
+def _cg_outofplace(A_fcn: Callable[[torch.Tensor], torch.Tensor],
+                   precond_fcn: Optional[Callable[[torch.Tensor], torch.Tensor]],
+                   B2: torch.Tensor, max_niter: int, eps: float) -> torch.Tensor:
+    # plain Fletcher-Reeves CG with neither in-place operations nor
+    # data-dependent control flow, usable under the functorch transforms
+    xk = torch.zeros_like(B2)
+    rk = B2 - A_fcn(xk)
+    zk = precond_fcn(rk) if precond_fcn is not None else rk
+    pk = zk
+    rkzk = _dot(rk, zk)
+    for _ in range(max_niter):
+        Apk = A_fcn(pk)
+        alphak = rkzk / _safedenom(_dot(pk, Apk), eps)
+        xk = xk + alphak * pk
+        rk = rk - alphak * Apk
+        zk = precond_fcn(rk) if precond_fcn is not None else rk
+        rkzk_1 = _dot(rk, zk)
+        betak = rkzk_1 / _safedenom(rkzk, eps)
+        rkzk = rkzk_1
+        pk = zk + betak * pk
+    return xk
+
+def _dot_out(r: torch.Tensor, z: torch.Tensor, tmp: torch.Tensor) -> torch.Tensor:
+    # _dot with the elementwise product written into the preallocated tmp
+    # instead of a freshly allocated temporary
+    torch.mul(r.conj(), z, out=tmp)
+    return tmp.sum(dim=-2, keepdim=True)
+
+def _cg_xr_update(rkzk: torch.Tensor, pk: torch.Tensor, Apk: torch.Tensor,
+                  xk: torch.Tensor, rk: torch.Tensor, eps: float,
+                  active: torch.Tensor, tmp: torch.Tensor) -> None:
+    # pointwise part of the CG iteration that updates the iterate and the
+    # residual in-place (the denominator is made branchless so it can be
+    # fused, and the fused-multiply-add addcmul_ does not allocate).
+    # the step size of the already-converged columns is zeroed so they are
+    # left frozen while the others keep iterating.
+    pApk = _dot_out(pk, Apk, tmp)
+    alphak = rkzk / _safedenom(pApk, eps)
+    alphak = torch.where(active, alphak, torch.zeros_like(alphak))
+    xk.addcmul_(alphak, pk)  # xk += alphak * pk
+    rk.addcmul_(alphak, Apk, value=-1)  # rk -= alphak * Apk
+
+def _cg_p_update_fr(rk: torch.Tensor, zk: torch.Tensor, rk_old: torch.Tensor,
+                    rkzk: torch.Tensor, pk: torch.Tensor, eps: float,
+                    tmp: torch.Tensor) -> torch.Tensor:
+    # pointwise part of the CG iteration that updates the search direction
+    # in-place with the Fletcher-Reeves formula
+    rkzk_1 = _dot_out(rk, zk, tmp)
+    betak = rkzk_1 / _safedenom(rkzk, eps)
+    pk.mul_(betak).add_(zk)  # pk = zk + betak * pk
+    return rkzk_1
+
+def _cg_p_update_pr(rk: torch.Tensor, zk: torch.Tensor, rk_old: torch.Tensor,
+                    rkzk: torch.Tensor, pk: torch.Tensor, eps: float,
+                    tmp: torch.Tensor) -> torch.Tensor:
+    # pointwise part of the CG iteration that updates the search direction
+    # in-place with the non-negative Polak-Ribiere formula, which resets the
+    # direction to the preconditioned residual when the iterations stagnate
+    torch.sub(rk, rk_old, out=tmp)
+    if torch.is_complex(tmp):
+        tmp.conj_physical_()
+    tmp.mul_(zk)
+    betak = tmp.sum(dim=-2, keepdim=True) / _safedenom(rkzk, eps)
+    if torch.is_complex(betak):
+        betak = betak.real
+    betak = torch.clamp(betak, min=0.0)
+    rkzk_1 = _dot_out(rk, zk, tmp)
+    pk.mul_(betak).add_(zk)  # pk = zk + betak * pk
+    return rkzk_1
+
+_cg_p_updates = {
+    "fr": _cg_p_update_fr,
+    "pr": _cg_p_update_pr,
+}
+
+@functools.lru_cache(maxsize=None)
+def _get_compiled_cg_updates(beta_method: str) -> Tuple[Callable, Callable]:
+    return (torch.compile(_cg_xr_update, fullgraph=True),
+            torch.compile(_cg_p_updates[beta_method], fullgraph=True))
+
+def _get_cg_updates(fuse_update: bool, beta_method: str) -> Tuple[Callable, Callable]:
+    if beta_method not in _cg_p_updates:
+        raise RuntimeError("Unknown beta_method %s" % beta_method)
+    if fuse_update and hasattr(torch, "compile"):
+        return _get_compiled_cg_updates(beta_method)
+    else:
+        return _cg_xr_update, _cg_p_updates[beta_method]
+
+############ rootfinder-based ############
+@functools.wraps(broyden1)
+def broyden1_solve(A, B, E=None, M=None, **options):
+    return _rootfinder_solve("broyden1", A, B, E, M, **options)
+
+def _rootfinder_solve(alg, A, B, E=None, M=None, **options):
+    # using rootfinder algorithm
+    nr = A.shape[-1]
+    ncols = B.shape[-1]
+
+    # set up the function for the rootfinding
+    def fcn_rootfinder(xi):
+        # xi: (*BX, nr*ncols)
+        x = xi.reshape(*xi.shape[:-1], nr, ncols)  # (*BX, nr, ncols)
+        y = A.mm(x) - B  # (*BX, nr, ncols)
+        if E is not None:
+            MX = M.mm(x) if M is not None else x
+            MXE = MX * E.unsqueeze(-2)
+            y = y - MXE  # (*BX, nr, ncols)
+        y = y.reshape(*xi.shape[:-1], -1)  # (*BX, nr*ncols)
+        return y
+
+    # setup the initial guess (the batch dimension must be the largest)
+    batchdims = _get_batchdims(A, B, E, M)
+    x0 = torch.zeros((*batchdims, nr * ncols), dtype=A.dtype, device=A.device)
+
+    if alg == "broyden1":
+        x = broyden1(fcn_rootfinder, x0, **options)
+    else:
+        raise RuntimeError("Unknown method %s" % alg)
+    x = x.reshape(*x.shape[:-1], nr, ncols)
+    return x
+
+############ exact solve ############
+def exactsolve(A: LinearOperator, B: torch.Tensor,
+               E: Union[torch.Tensor, None],
+               M: Union[LinearOperator, None]):
+    """
+    Solve the linear equation by contructing the full matrix of LinearOperators.
+
+    Warnings
+    --------
+    * As this method construct the linear operators explicitly, it might requires
+      a large memory.
+    """
+    # A: (*BA, na, na)
+    # B: (*BB, na, ncols)
+    # E: (*BE, ncols)
+    # M: (*BM, na, na)
+    if E is None:
+        Amatrix = A.fullmatrix()  # (*BA, na, na)
+        x = torch.linalg.solve(Amatrix, B)  # (*BAB, na, ncols)
+    elif M is None:
+        Amatrix = A.fullmatrix()
+        x = _solve_ABE(Amatrix, B, E)
+    else:
+        Mmatrix = M.fullmatrix()  # (*BM, na, na)
+        L = torch.linalg.cholesky(Mmatrix)  # (*BM, na, na)
+        Linv = torch.inverse(L)  # (*BM, na, na)
+        LinvT = Linv.transpose(-2, -1).conj()  # (*BM, na, na)
+        A2 = torch.matmul(Linv, A.mm(LinvT))  # (*BAM, na, na)
+        B2 = torch.matmul(Linv, B)  # (*BBM, na, ncols)
+
+        X2 = _solve_ABE(A2, B2, E)  # (*BABEM, na, ncols)
+        x = torch.matmul(LinvT, X2)  # (*BABEM, na, ncols)
+    return x
+
+def _solve_ABE(A: torch.Tensor, B: torch.Tensor, E: torch.Tensor):
+    # A: (*BA, na, na) matrix
+    # B: (*BB, na, ncols) matrix
+    # E: (*BE, ncols) matrix
+    na = A.shape[-1]
+    BA, BB, BE = normalize_bcast_dims(A.shape[:-2], B.shape[:-2], E.shape[:-1])
+    E = E.reshape(1, *BE, E.shape[-1]).transpose(0, -1)  # (ncols, *BE, 1)
+    B = B.reshape(1, *BB, *B.shape[-2:]).transpose(0, -1)  # (ncols, *BB, na, 1)
+
+    # NOTE: The line below is very inefficient for large na and ncols
+    AE = A - torch.diag_embed(E.repeat_interleave(repeats=na, dim=-1), dim1=-2, dim2=-1)  # (ncols, *BAE, na, na)
+    r = torch.linalg.solve(AE, B)  # (ncols, *BAEM, na, 1)
+    r = r.transpose(0, -1).squeeze(0)  # (*BAEM, na, ncols)
+    return r
+
+############ general helpers ############
+def _get_batchdims(A: LinearOperator, B: torch.Tensor,
+                   E: Union[torch.Tensor, None],
+                   M: Union[LinearOperator, None]):
+
+    batchdims = [A.shape[:-2], B.shape[:-2]]
+    if E is not None:
+        batchdims.append(E.shape[:-1])
+        if M is not None:
+            batchdims.append(M.shape[:-2])
+    return get_bcasted_dims(*batchdims)
+
+def _setup_matmul_fcns(A: LinearOperator) -> \
+        Tuple[Callable[[torch.Tensor], torch.Tensor],
+              Callable[[torch.Tensor], torch.Tensor]]:
+    # construct the mm and rmm callables of the operator to be applied in the
+    # solvers' inner loops.
+    # operators with an explicit matrix get a direct torch.matmul on the
+    # stored matrix, so all the columns are multiplied in a single call
+    # without going through the LinearOperator dispatch every iteration.
+    if isinstance(A, MatrixLinearOperator):
+        mat = A.fullmatrix()
+        matH = mat.transpose(-2, -1).conj()
+        return (lambda x: torch.matmul(mat, x)), (lambda x: torch.matmul(matH, x))
+    else:
+        return (lambda x: A.mm(x)), (lambda x: A.rmm(x))
+
+def _setup_precond(precond: Optional[LinearOperator]) \
+        -> Optional[Callable[[torch.Tensor], torch.Tensor]]:
+    if isinstance(precond, LinearOperator):
+        precond_fcn = lambda x: precond.mm(x)
+    elif precond is None:
+        # no preconditioner: return None (instead of an identity function) so
+        # the callers can skip the application in their inner loops
+        precond_fcn = None
+    else:
+        raise TypeError("precond can only be LinearOperator or None")
+    return precond_fcn
+
+# cache of the linear-problem setups (matvec closures and the posdef
+# classification), only used when a solver opts in with cache_setup=True.
+# the entries hold weak references to the operands and the keys include the
+# version counters of the parameter tensors, so neither a garbage-collected
+# (and id-reused) operand nor an in-place parameter update can produce a
+# stale hit
+_linear_problem_cache: dict = {}
+_linear_problem_cache_maxsize = 8
+
+def _setup_linear_problem(A: LinearOperator, B: torch.Tensor,
+                          E: Optional[torch.Tensor], M: Optional[LinearOperator],
+                          batchdims: Sequence[int],
+                          posdef: Optional[bool],
+                          need_hermit: bool,
+                          use_cache: bool = False) -> \
+        Tuple[Callable[[torch.Tensor], torch.Tensor],
+              Callable[[torch.Tensor], torch.Tensor],
+              torch.Tensor, bool]:
+    if not use_cache:
+        fcns = _build_linear_problem(A, tuple(B.shape), E, M, tuple(batchdims),
+                                     posdef, need_hermit)
+        A_fcn, AT_fcn, b_fcn, col_swapped = fcns
+        return A_fcn, AT_fcn, b_fcn(B), col_swapped
+
+    # repeated solves with the same operators (e.g. the forward solve and the
+    # adjoint solve in every backward pass, which reuses A for Hermitian
+    # problems) rebuild identical matvec closures and redo the posdef power
+    # iteration every call, so the setup is cached keyed on the identity and
+    # the version of the operators' current parameters
+    params = A.getlinopparams()
+    mparams = M.getlinopparams() if M is not None else ()
+    key = (id(A), (id(E), E._version) if E is not None else None, id(M),
+           tuple((id(p), p._version) for p in params),
+           tuple((id(p), p._version) for p in mparams),
+           tuple(B.shape), posdef, need_hermit)
+    operands = tuple(o for o in (A, E, M, *params, *mparams) if o is not None)
+    entry = _linear_problem_cache.get(key, None)
+    # guard against an id in the key having been reused by a new object
+    if entry is not None and not all(r() is o for r, o in zip(entry[0], operands)):
+        entry = None
+    if entry is None:
+        # drop the entries whose operands have been garbage collected
+        for k in [k for k, v in _linear_problem_cache.items()
+                  if any(r() is None for r in v[0])]:
+            del _linear_problem_cache[k]
+        fcns = _build_linear_problem(A, tuple(B.shape), E, M, tuple(batchdims),
+                                     posdef, need_hermit)
+        _linear_problem_cache[key] = (tuple(map(weakref.ref, operands)), fcns)
+        if len(_linear_problem_cache) > _linear_problem_cache_maxsize:
+            del _linear_problem_cache[next(iter(_linear_problem_cache))]
+    else:
+        fcns = entry[1]
+    A_fcn, AT_fcn, b_fcn, col_swapped = fcns
+    return A_fcn, AT_fcn, b_fcn(B), col_swapped
+
+def _build_linear_problem(A: LinearOperator, Bshape: Tuple[int, ...],
+                          E: Optional[torch.Tensor], M: Optional[LinearOperator],
+                          batchdims: Sequence[int],
+                          posdef: Optional[bool],
+                          need_hermit: bool) -> \
+        Tuple[Callable[[torch.Tensor], torch.Tensor],
+              Callable[[torch.Tensor], torch.Tensor],
+              Callable[[torch.Tensor], torch.Tensor], bool]:
+    # construct the matvec closures of the linear problem and the function
+    # that brings B to the problem's layout, so everything that only depends
+    # on the operators (not on the values of B) can be cached by the caller
+
+    # get the linear operator (including the MXE part)
+    A_mm, A_rmm = _setup_matmul_fcns(A)
+    if E is None:
+        A_fcn = A_mm
+        AT_fcn = A_rmm
+        b_fcn = lambda B: B
+        col_swapped = False
+    else:
+        # A: (*BA, nr, nr) linop
+        # B: (*BB, nr, ncols)
+        # E: (*BE, ncols)
+        # M: (*BM, nr, nr) linop
+        if M is None:
+            BAs, BBs, BEs = normalize_bcast_dims(A.shape[:-2], Bshape[:-2], E.shape[:-1])
+        else:
+            BAs, BBs, BEs, BMs = normalize_bcast_dims(A.shape[:-2], Bshape[:-2],
+                                                      E.shape[:-1], M.shape[:-2])
+        E = E.reshape(*BEs, *E.shape[-1:])
+        E_new = E.unsqueeze(0).transpose(-1, 0).unsqueeze(-1)  # (ncols, *BEs, 1, 1)
+
+        def b_fcn(B):
+            B = B.reshape(*BBs, *B.shape[-2:])  # (*BBs, nr, ncols)
+            return B.unsqueeze(0).transpose(-1, 0)  # (ncols, *BBs, nr, 1)
+
+        # specialize the closures on whether M is present, so the matvec
+        # called every iteration carries no leftover branch
+        if M is None:
+            def A_fcn(x):
+                # x: (ncols, *BX, nr, 1)
+                return A_mm(x) - x * E_new  # (ncols, *BAXE, nr, 1)
+
+            def AT_fcn(x):
+                # x: (ncols, *BX, nr, 1)
+                return A_rmm(x) - x * E_new
+        else:
+            M_mm, M_rmm = _setup_matmul_fcns(M)
+
+            def A_fcn(x):
+                # x: (ncols, *BX, nr, 1)
+                return A_mm(x) - M_mm(x) * E_new  # (ncols, *BAMXE, nr, 1)
+
+            def AT_fcn(x):
+                # x: (ncols, *BX, nr, 1)
+                return A_rmm(x) - M_rmm(x) * E_new
+
+        col_swapped = True
+
+    # estimate if it's posdef with power iteration
+    if need_hermit:
+        is_hermit = A.is_hermitian and (M is None or M.is_hermitian)
+        if not is_hermit:
+            # set posdef to False to make the operator becomes AT * A so it is
+            # hermitian
+            posdef = False
+
+    # TODO: the posdef check by largest eival only works for Hermitian/symmetric
+    # matrix, but it doesn't always work for non-symmetric matrix.
+    # In non-symmetric case, one need to do Cholesky LDL decomposition
+    if posdef is None:
+        nr, ncols = Bshape[-2:]
+        x0shape = (ncols, *batchdims, nr, 1) if col_swapped else (*batchdims, nr, ncols)
+        x0 = torch.randn(x0shape, dtype=A.dtype, device=A.device)
+        x0 = x0 / x0.norm(dim=-2, keepdim=True)
+        largest_eival = _get_largest_eival(A_fcn, x0)  # (*, 1, nc)
+        negeival = largest_eival <= 0
+
+        # if the largest eigenvalue is negative, then it's not posdef
+        if torch.all(negeival):
+            posdef = False
+
+        # otherwise, calculate the lowest eigenvalue to check if it's positive
+        else:
+            offset = torch.clamp(largest_eival, min=0.0)
+            A_fcn2 = lambda x: A_fcn(x) - offset * x
+            mostneg_eival = _get_largest_eival(A_fcn2, x0)  # (*, 1, nc)
+            posdef = bool(torch.all(torch.logical_or(-mostneg_eival <= offset, negeival)).item())
+
+    # get the linear operation if it is not a posdef (A -> AT.A)
+    if posdef:
+        return A_fcn, AT_fcn, b_fcn, col_swapped
+    else:
+        def A_new_fcn(x):
+            return AT_fcn(A_fcn(x))
+
+        def b2_fcn(B):
+            return AT_fcn(b_fcn(B))
+        return A_new_fcn, A_new_fcn, b2_fcn, col_swapped
+
+def _get_largest_eival(Afcn, x):
+    niter = 10
+    rtol = 1e-3
+    atol = 1e-6
+    xnorm_prev = None
+    for i in range(niter):
+        x = Afcn(x)  # (*, nr, nc)
+        xnorm = x.norm(dim=-2, keepdim=True)  # (*, 1, nc)
+
+        # check if xnorm is converging
+        if i > 0:
+            dnorm = torch.abs(xnorm_prev - xnorm)
+            if torch.all(dnorm <= rtol * xnorm + atol):
+                break
+
+        xnorm_prev = xnorm
+        if i < niter - 1:
+            x = x / xnorm
+    return xnorm
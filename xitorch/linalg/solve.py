@@ -1,243 +1,389 @@
-import torch
-import warnings
-from typing import Union, Any, Mapping, Optional, Callable
-from xitorch import LinearOperator
-from xitorch._core.linop import MatrixLinearOperator
-from xitorch._utils.assertfuncs import assert_runtime
-from xitorch._utils.misc import set_default_option, dummy_context_manager, get_method
-from xitorch._docstr.api_docstr import get_methods_docstr
-from xitorch.debug.modes import is_debug_enabled
-from xitorch._impls.linalg.solve import exactsolve, wrap_gmres, \
-    cg, bicgstab, broyden1_solve, _get_batchdims, gmres
-
-def solve(A: LinearOperator, B: torch.Tensor, E: Union[torch.Tensor, None] = None,
-          M: Optional[LinearOperator] = None,
-          bck_options: Mapping[str, Any] = {},
-          method: Union[str, Callable, None] = None,
-          **fwd_options) -> torch.Tensor:
-    r"""
-    Performing iterative method to solve the equation
-
-    .. math::
-
-        \mathbf{AX=B}
-
-    or
-
-    .. math::
-
-        \mathbf{AX-MXE=B}
-
-    where :math:`\mathbf{E}` is a diagonal matrix.
-    This function can also solve batched multiple inverse equation at the
-    same time by applying :math:`\mathbf{A}` to a tensor :math:`\mathbf{X}`
-    with shape ``(...,na,ncols)``.
-    The applied :math:`\mathbf{E}` are not necessarily identical for each column.
-
-    Arguments
-    ---------
-    A: xitorch.LinearOperator
-        A linear operator that takes an input ``X`` and produce the vectors in the same
-        space as ``B``.
-        It should have the shape of ``(*BA, na, na)``
-    B: torch.Tensor
-        The tensor on the right hand side with shape ``(*BB, na, ncols)``
-    E: torch.Tensor or None
-        If a tensor, it will solve :math:`\mathbf{AX-MXE = B}`.
-        It will be regarded as the diagonal of the matrix.
-        Otherwise, it just solves :math:`\mathbf{AX = B}` and ``M`` is ignored.
-        If it is a tensor, it should have shape of ``(*BE, ncols)``.
-    M: xitorch.LinearOperator or None
-        The transformation on the ``E`` side. If ``E`` is ``None``,
-        then this argument is ignored.
-        If E is not ``None`` and ``M`` is ``None``, then ``M=I``.
-        If LinearOperator, it must be Hermitian with shape ``(*BM, na, na)``.
-    bck_options: dict
-        Options of the iterative solver in the backward calculation.
-    method: str or callable or None
-        The method of linear equation solver. If ``None``, it will choose
-        ``"cg"`` or ``"bicgstab"`` based on the matrices symmetry.
-        `Note`: default method will be changed quite frequently, so if you want
-        future compatibility, please specify a method.
-    **fwd_options
-        Method-specific options (see method below)
-
-    Returns
-    -------
-    torch.Tensor
-        The tensor :math:`\mathbf{X}` that satisfies :math:`\mathbf{AX-MXE=B}`.
-    """
-    assert_runtime(A.shape[-1] == A.shape[-2], "The linear operator A must have a square shape")
-    assert_runtime(A.shape[-1] == B.shape[-2], "Mismatch shape of A & B (A: %s, B: %s)" % (A.shape, B.shape))
-    assert_runtime(
-        not torch.is_grad_enabled() or A.is_getparamnames_implemented,
-        "The _getparamnames(self, prefix) of linear operator A must be "
-        "implemented if using solve with grad enabled")
-    if M is not None:
-        assert_runtime(M.shape[-1] == M.shape[-2], "The linear operator M must have a square shape")
-        assert_runtime(M.shape[-1] == A.shape[-1], "The shape of A & M must match (A: %s, M: %s)" % (A.shape, M.shape))
-        assert_runtime(M.is_hermitian, "The linear operator M must be a Hermitian matrix")
-        assert_runtime(
-            not torch.is_grad_enabled() or M.is_getparamnames_implemented,
-            "The _getparamnames(self, prefix) of linear operator M must be "
-            "implemented if using solve with grad enabled")
-    if E is not None:
-        assert_runtime(E.shape[-1] == B.shape[-1],
-                       "The last dimension of E & B must match (E: %s, B: %s)" % (E.shape, B.shape))
-    if E is None and M is not None:
-        warnings.warn("M is supplied but will be ignored because E is not supplied")
-
-    # perform expensive check if debug mode is enabled
-    if is_debug_enabled():
-        A.check()
-        if M is not None:
-            M.check()
-
-    if method is None:
-        if isinstance(A, MatrixLinearOperator) and \
-           (M is None or isinstance(M, MatrixLinearOperator)):
-            method = "exactsolve"
-        elif A.shape[-1] <= 5:  # for small matrix
-            method = "exactsolve"
-        else:
-            is_hermit = A.is_hermitian and (M is None or M.is_hermitian)
-            method = "cg" if is_hermit else "bicgstab"
-
-    if method == "exactsolve":
-        return exactsolve(A, B, E, M)
-    else:
-        # get the unique parameters of A
-        params = A.getlinopparams()
-        mparams = M.getlinopparams() if M is not None else []
-        na = len(params)
-        return solve_torchfcn.apply(
-            A, B, E, M, method,
-            fwd_options, bck_options,
-            na, *params, *mparams)
-
-class solve_torchfcn(torch.autograd.Function):
-    @staticmethod
-    def forward(ctx, A, B, E, M, method,
-                fwd_options, bck_options,
-                na, *all_params):
-        # A: (*BA, nr, nr)
-        # B: (*BB, nr, ncols)
-        # E: (*BE, ncols) or None
-        # M: (*BM, nr, nr) or None
-        # all_params: list of tensor of any shape
-        # returns: (*BABEM, nr, ncols)
-
-        # separate the parameters for A and for M
-        params = all_params[:na]
-        mparams = all_params[na:]
-
-        config = set_default_option({
-        }, fwd_options)
-        ctx.bck_config = set_default_option({
-        }, bck_options)
-
-        if torch.all(B == 0):  # special case
-            dims = (*_get_batchdims(A, B, E, M), *B.shape[-2:])
-            x = torch.zeros(dims, dtype=B.dtype, device=B.device)
-        else:
-            with A.uselinopparams(*params), M.uselinopparams(*mparams) if M is not None else dummy_context_manager():
-                methods = {
-                    "custom_exactsolve": custom_exactsolve,
-                    "scipy_gmres": wrap_gmres,
-                    "broyden1": broyden1_solve,
-                    "cg": cg,
-                    "bicgstab": bicgstab,
-                    "gmres": gmres,
-                }
-                method_fcn = get_method("solve", methods, method)
-                x = method_fcn(A, B, E, M, **config)
-
-        ctx.e_is_none = E is None
-        ctx.A = A
-        ctx.M = M
-        if ctx.e_is_none:
-            ctx.save_for_backward(x, *all_params)
-        else:
-            ctx.save_for_backward(x, E, *all_params)
-        ctx.na = na
-        return x
-
-    @staticmethod
-    def backward(ctx, grad_x):
-        # grad_x: (*BABEM, nr, ncols)
-        # x: (*BABEM, nr, ncols)
-        x = ctx.saved_tensors[0]
-        idx_all_params = 1 if ctx.e_is_none else 2
-        all_params = ctx.saved_tensors[idx_all_params:]
-        params = all_params[:ctx.na]
-        mparams = all_params[ctx.na:]
-        E = None if ctx.e_is_none else ctx.saved_tensors[1]
-
-        # solve (A-biases*M)^T v = grad_x
-        # this is the grad of B
-        with ctx.A.uselinopparams(*params), \
-             ctx.M.uselinopparams(*mparams) if ctx.M is not None else dummy_context_manager():
-            AT = ctx.A.H  # (*BA, nr, nr)
-            MT = ctx.M.H if ctx.M is not None else None  # (*BM, nr, nr)
-            Econj = E.conj() if E is not None else None
-            v = solve(AT, grad_x, Econj, MT,
-                      bck_options=ctx.bck_config, **ctx.bck_config)  # (*BABEM, nr, ncols)
-        grad_B = v
-
-        # calculate the grad of matrices parameters
-        with torch.enable_grad():
-            params = [p.clone().requires_grad_() for p in params]
-            with ctx.A.uselinopparams(*params):
-                loss = -ctx.A.mm(x)  # (*BABEM, nr, ncols)
-
-        grad_params = torch.autograd.grad((loss,), params, grad_outputs=(v,),
-                                          create_graph=torch.is_grad_enabled(),
-                                          allow_unused=True)
-
-        # calculate the biases gradient
-        grad_E = None
-        if E is not None:
-            if ctx.M is None:
-                Mx = x
-            else:
-                with ctx.M.uselinopparams(*mparams):
-                    Mx = ctx.M.mm(x)  # (*BABEM, nr, ncols)
-            grad_E = torch.einsum('...rc,...rc->...c', v, Mx.conj())  # (*BABEM, ncols)
-
-        # calculate the gradient to the biases matrices
-        grad_mparams = []
-        if ctx.M is not None and E is not None:
-            with torch.enable_grad():
-                mparams = [p.clone().requires_grad_() for p in mparams]
-                lmbdax = x * E.unsqueeze(-2)
-                with ctx.M.uselinopparams(*mparams):
-                    mloss = ctx.M.mm(lmbdax)
-
-            grad_mparams = torch.autograd.grad((mloss,), mparams,
-                                               grad_outputs=(v,),
-                                               create_graph=torch.is_grad_enabled(),
-                                               allow_unused=True)
-
-        return (None, grad_B, grad_E, None, None, None, None, None,
-                *grad_params, *grad_mparams)
-
-def custom_exactsolve(A, B, E=None,
-                      M=None, **options):
-    # A: (*BA, na, na)
-    # B: (*BB, na, ncols)
-    # E: (*BE, ncols)
-    # M: (*BM, na, na)
-    return exactsolve(A, B, E, M)
-
-
-# docstring completion
-_solve_methods = {
-    "cg": cg,
-    "bicgstab": bicgstab,
-    "exactsolve": exactsolve,
-    "broyden1": broyden1_solve,
-    "scipy_gmres": wrap_gmres,
-    "gmres": gmres,
-}
-ignore_kwargs = ["E", "M", "mparams"]
-solve.__doc__ = get_methods_docstr(solve, _solve_methods, ignore_kwargs)
+import torch
+import warnings
+from typing import Union, Any, Mapping, Optional, Callable
+from xitorch import LinearOperator
+from xitorch._core.linop import MatrixLinearOperator
+from xitorch._utils.assertfuncs import assert_runtime
+from xitorch._utils.misc import set_default_option, dummy_context_manager, get_method
+from xitorch._docstr.api_docstr import get_methods_docstr
+from xitorch.debug.modes import is_debug_enabled
+from xitorch._impls.linalg.solve import exactsolve, wrap_gmres, wrap_cg, \
+    cg, blockcg, minres, bicgstab, broyden1_solve, _get_batchdims, gmres, \
+    _is_batchedtensor
+
+def solve(A: LinearOperator, B: torch.Tensor, E: Union[torch.Tensor, None] = None,
+          M: Optional[LinearOperator] = None,
+          bck_options: Mapping[str, Any] = {},
+          method: Union[str, Callable, None] = None,
+          **fwd_options) -> torch.Tensor:
+    r"""
+    Performing iterative method to solve the equation
+
+    .. math::
+
+        \mathbf{AX=B}
+
+    or
+
+    .. math::
+
+        \mathbf{AX-MXE=B}
+
+    where :math:`\mathbf{E}` is a diagonal matrix.
+    This function can also solve batched multiple inverse equation at the
+    same time by applying :math:`\mathbf{A}` to a tensor :math:`\mathbf{X}`
+    with shape ``(...,na,ncols)``.
+    The applied :math:`\mathbf{E}` are not necessarily identical for each column.
+
+    Arguments
+    ---------
+    A: xitorch.LinearOperator
+        A linear operator that takes an input ``X`` and produce the vectors in the same
+        space as ``B``.
+        It should have the shape of ``(*BA, na, na)``
+    B: torch.Tensor
+        The tensor on the right hand side with shape ``(*BB, na, ncols)``
+    E: torch.Tensor or None
+        If a tensor, it will solve :math:`\mathbf{AX-MXE = B}`.
+        It will be regarded as the diagonal of the matrix.
+        Otherwise, it just solves :math:`\mathbf{AX = B}` and ``M`` is ignored.
+        If it is a tensor, it should have shape of ``(*BE, ncols)``.
+    M: xitorch.LinearOperator or None
+        The transformation on the ``E`` side. If ``E`` is ``None``,
+        then this argument is ignored.
+        If E is not ``None`` and ``M`` is ``None``, then ``M=I``.
+        If LinearOperator, it must be Hermitian with shape ``(*BM, na, na)``.
+    bck_options: dict
+        Options of the iterative solver in the backward calculation.
+    method: str or callable or None
+        The method of linear equation solver. If ``None``, it will choose
+        ``"cg"`` or ``"bicgstab"`` based on the matrices symmetry.
+        `Note`: default method will be changed quite frequently, so if you want
+        future compatibility, please specify a method.
+    **fwd_options
+        Method-specific options (see method below)
+
+    Returns
+    -------
+    torch.Tensor
+        The tensor :math:`\mathbf{X}` that satisfies :math:`\mathbf{AX-MXE=B}`.
+    """
+    assert_runtime(A.shape[-1] == A.shape[-2], "The linear operator A must have a square shape")
+    assert_runtime(A.shape[-1] == B.shape[-2], "Mismatch shape of A & B (A: %s, B: %s)" % (A.shape, B.shape))
+    assert_runtime(
+        not torch.is_grad_enabled() or A.is_getparamnames_implemented,
+        "The _getparamnames(self, prefix) of linear operator A must be "
+        "implemented if using solve with grad enabled")
+    if M is not None:
+        assert_runtime(M.shape[-1] == M.shape[-2], "The linear operator M must have a square shape")
+        assert_runtime(M.shape[-1] == A.shape[-1], "The shape of A & M must match (A: %s, M: %s)" % (A.shape, M.shape))
+        assert_runtime(M.is_hermitian, "The linear operator M must be a Hermitian matrix")
+        assert_runtime(
+            not torch.is_grad_enabled() or M.is_getparamnames_implemented,
+            "The _getparamnames(self, prefix) of linear operator M must be "
+            "implemented if using solve with grad enabled")
+    if E is not None:
+        assert_runtime(E.shape[-1] == B.shape[-1],
+                       "The last dimension of E & B must match (E: %s, B: %s)" % (E.shape, B.shape))
+    if E is None and M is not None:
+        warnings.warn("M is supplied but will be ignored because E is not supplied")
+
+    # perform expensive check if debug mode is enabled
+    if is_debug_enabled():
+        A.check()
+        if M is not None:
+            M.check()
+
+    if method is None:
+        method = _get_default_method(A, M)
+
+    if method == "exactsolve":
+        return exactsolve(A, B, E, M)
+    else:
+        # get the unique parameters of A
+        params = A.getlinopparams()
+        mparams = M.getlinopparams() if M is not None else []
+        na = len(params)
+        if not torch.is_grad_enabled():
+            # no graph is being built: skip the autograd.Function machinery
+            # (this also makes the iterative methods usable under functorch
+            # transforms, which cannot go through an old-style Function)
+            config = dict(fwd_options)
+            config.pop("recompute_x", None)
+            return _solve_fwd(A, B, E, M, method, config, params, mparams)
+        return solve_torchfcn.apply(
+            A, B, E, M, method,
+            fwd_options, bck_options,
+            na, *params, *mparams)
+
+def solve_batched(A: LinearOperator, B: torch.Tensor,
+                  E: Union[torch.Tensor, None] = None,
+                  M: Optional[LinearOperator] = None,
+                  in_dims: Union[int, tuple] = 0,
+                  out_dims: int = 0,
+                  bck_options: Mapping[str, Any] = {},
+                  method: Union[str, Callable, None] = None,
+                  **fwd_options) -> torch.Tensor:
+    r"""
+    Solve a batch of independent linear equations :math:`\mathbf{AX-MXE=B}`
+    with :func:`torch.vmap` over an extra leading dimension of ``B`` (and
+    optionally ``E``), instead of looping over the batch in Python.
+    The operators ``A`` and ``M`` are shared across the batch.
+
+    As ``vmap`` does not support data-dependent control flow, the method must
+    be free of early-exit synchronizations: this holds for ``"exactsolve"``
+    (the default for explicit-matrix operators) and for ``"cg"``, which then
+    runs a fixed-iteration out-of-place variant that takes the last iterate
+    without a convergence check.
+    Taking gradients w.r.t. the operators' parameters through the batched
+    solve is not supported; run it under ``torch.no_grad()``.
+
+    Arguments
+    ---------
+    A: xitorch.LinearOperator
+        A linear operator with the shape of ``(*BA, na, na)``, shared across
+        the batch.
+    B: torch.Tensor
+        The tensors on the right hand side with an extra batch dimension at
+        the position indicated by ``in_dims``, i.e. shape ``(nbatch, *BB, na,
+        ncols)`` for ``in_dims=0``.
+    E: torch.Tensor or None
+        The diagonal of the matrix :math:`\mathbf{E}` (see :func:`solve`).
+        It is shared across the batch unless ``in_dims`` is a tuple that maps
+        a batch dimension for it.
+    M: xitorch.LinearOperator or None
+        The transformation on the ``E`` side, shared across the batch.
+    in_dims: int or tuple
+        The batch dimension of ``B``, or a tuple of the batch dimensions of
+        ``(B, E)`` following :func:`torch.vmap` (``None`` for not batched).
+    out_dims: int
+        Where the batch dimension appears in the returned tensor.
+    bck_options: dict
+        Options of the iterative solver in the backward calculation.
+    method: str or callable or None
+        The method of linear equation solver (see :func:`solve`).
+    **fwd_options
+        Method-specific options (see :func:`solve`).
+
+    Returns
+    -------
+    torch.Tensor
+        The solutions with the batch dimension at ``out_dims``.
+    """
+    vmap = _get_vmap()
+    if E is None:
+        fcn = lambda B: solve(A, B, None, M, bck_options=bck_options,
+                              method=method, **fwd_options)
+        bin_dims = in_dims if isinstance(in_dims, int) else in_dims[0]
+        return vmap(fcn, in_dims=bin_dims, out_dims=out_dims)(B)
+    else:
+        fcn = lambda B, E: solve(A, B, E, M, bck_options=bck_options,
+                                 method=method, **fwd_options)
+        if isinstance(in_dims, int):
+            in_dims = (in_dims, None)
+        return vmap(fcn, in_dims=in_dims, out_dims=out_dims)(B, E)
+
+def _get_vmap() -> Callable:
+    # torch.vmap is only public from torch 2.0 on; before that it lives in
+    # the separate functorch package
+    vmap = getattr(torch, "vmap", None)
+    if vmap is None:
+        try:
+            from functorch import vmap  # type: ignore
+        except ImportError:
+            raise RuntimeError(
+                "solve_batched requires torch.vmap or the functorch package")
+    return vmap
+
+class solve_torchfcn(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, A, B, E, M, method,
+                fwd_options, bck_options,
+                na, *all_params):
+        # A: (*BA, nr, nr)
+        # B: (*BB, nr, ncols)
+        # E: (*BE, ncols) or None
+        # M: (*BM, nr, nr) or None
+        # all_params: list of tensor of any shape
+        # returns: (*BABEM, nr, ncols)
+
+        # separate the parameters for A and for M
+        params = all_params[:na]
+        mparams = all_params[na:]
+
+        config = set_default_option({
+            "recompute_x": False,
+        }, fwd_options)
+        ctx.bck_config = set_default_option({
+        }, bck_options)
+        # if True, x is not stashed for the backward pass, but recomputed from
+        # B (checkpoint semantics) to reduce the retained activation memory
+        recompute_x = config.pop("recompute_x")
+
+        x = _solve_fwd(A, B, E, M, method, config, params, mparams)
+
+        ctx.e_is_none = E is None
+        ctx.A = A
+        ctx.M = M
+        ctx.method = method
+        ctx.config = config
+        ctx.recompute_x = recompute_x
+        xb = B if recompute_x else x
+        if ctx.e_is_none:
+            ctx.save_for_backward(xb, *all_params)
+        else:
+            ctx.save_for_backward(xb, E, *all_params)
+        ctx.na = na
+        return x
+
+    @staticmethod
+    def backward(ctx, grad_x):
+        # grad_x: (*BABEM, nr, ncols)
+        # x: (*BABEM, nr, ncols)
+        idx_all_params = 1 if ctx.e_is_none else 2
+        all_params = ctx.saved_tensors[idx_all_params:]
+        params = all_params[:ctx.na]
+        mparams = all_params[ctx.na:]
+        E = None if ctx.e_is_none else ctx.saved_tensors[1]
+        if ctx.recompute_x:
+            # the first saved tensor is B: redo the (cheap) forward solve
+            B = ctx.saved_tensors[0]
+            if torch.is_grad_enabled():
+                # double backward: rebuild the graph of x w.r.t. the params
+                x = solve_torchfcn.apply(ctx.A, B, E, ctx.M, ctx.method,
+                                         ctx.config, ctx.bck_config, ctx.na,
+                                         *all_params)
+            else:
+                with torch.no_grad():
+                    x = _solve_fwd(ctx.A, B, E, ctx.M, ctx.method, ctx.config,
+                                   params, mparams)
+        else:
+            x = ctx.saved_tensors[0]
+
+        # solve (A-biases*M)^T v = grad_x
+        # this is the grad of B
+        with ctx.A.uselinopparams(*params), \
+             ctx.M.uselinopparams(*mparams) if ctx.M is not None else dummy_context_manager():
+            AT = ctx.A.H  # (*BA, nr, nr)
+            MT = ctx.M.H if ctx.M is not None else None  # (*BM, nr, nr)
+            Econj = E.conj() if E is not None else None
+            if torch.is_grad_enabled():
+                v = solve(AT, grad_x, Econj, MT,
+                          bck_options=ctx.bck_config, **ctx.bck_config)  # (*BABEM, nr, ncols)
+            else:
+                # no grad-of-grad graph is needed: skip the autograd.Function
+                # machinery of solve (and its input checks, which the forward
+                # already passed) and go straight to the solver, resolving the
+                # default method the same way solve() does
+                config = dict(ctx.bck_config)
+                config.pop("recompute_x", None)
+                bck_method = config.pop("method", None)
+                if bck_method is None:
+                    bck_method = _get_default_method(AT, MT)
+                if bck_method == "exactsolve":
+                    v = exactsolve(AT, grad_x, Econj, MT)
+                else:
+                    vparams = AT.getlinopparams()
+                    vmparams = MT.getlinopparams() if MT is not None else []
+                    v = _solve_fwd(AT, grad_x, Econj, MT, bck_method, config,
+                                   vparams, vmparams)  # (*BABEM, nr, ncols)
+        grad_B = v
+
+        # calculate the grad of matrices parameters
+        with torch.enable_grad():
+            # detach the params to use as the grad inputs: detach is
+            # storage-free (unlike clone) and the fresh tensors are not
+            # reachable from the history of the saved x, so the engine does
+            # not walk back into this very node through them
+            params = [p.detach().requires_grad_() for p in params]
+            with ctx.A.uselinopparams(*params):
+                loss = -ctx.A.mm(x)  # (*BABEM, nr, ncols)
+
+        grad_params = torch.autograd.grad((loss,), params, grad_outputs=(v,),
+                                          create_graph=torch.is_grad_enabled(),
+                                          allow_unused=True)
+
+        # calculate the biases gradient
+        grad_E = None
+        if E is not None:
+            if ctx.M is None:
+                Mx = x
+            else:
+                with ctx.M.uselinopparams(*mparams):
+                    Mx = ctx.M.mm(x)  # (*BABEM, nr, ncols)
+            grad_E = torch.einsum('...rc,...rc->...c', v, Mx.conj())  # (*BABEM, ncols)
+
+        # calculate the gradient to the biases matrices
+        grad_mparams = []
+        if ctx.M is not None and E is not None:
+            # lmbdax is a constant w.r.t. mparams, so it is computed in the
+            # ambient grad mode (i.e. untracked unless a grad-of-grad graph is
+            # being built): only the M application below enters the tape
+            lmbdax = x * E.unsqueeze(-2)
+            with torch.enable_grad():
+                mparams = [p.detach().requires_grad_() for p in mparams]
+                with ctx.M.uselinopparams(*mparams):
+                    mloss = ctx.M.mm(lmbdax)
+
+            grad_mparams = torch.autograd.grad((mloss,), mparams,
+                                               grad_outputs=(v,),
+                                               create_graph=torch.is_grad_enabled(),
+                                               allow_unused=True)
+
+        return (None, grad_B, grad_E, None, None, None, None, None,
+                *grad_params, *grad_mparams)
+
+def _get_default_method(A: LinearOperator, M: Optional[LinearOperator]) -> str:
+    if isinstance(A, MatrixLinearOperator) and \
+       (M is None or isinstance(M, MatrixLinearOperator)):
+        return "exactsolve"
+    elif A.shape[-1] <= 5:  # for small matrix
+        return "exactsolve"
+    else:
+        is_hermit = A.is_hermitian and (M is None or M.is_hermitian)
+        return "cg" if is_hermit else "bicgstab"
+
+def _solve_fwd(A, B, E, M, method, config, params, mparams):
+    # perform the actual forward solve (shared between solve_torchfcn.forward
+    # and the recompute_x path in its backward)
+    if not _is_batchedtensor(B) and torch.all(B == 0):  # special case
+        dims = (*_get_batchdims(A, B, E, M), *B.shape[-2:])
+        return torch.zeros(dims, dtype=B.dtype, device=B.device)
+    with A.uselinopparams(*params), M.uselinopparams(*mparams) if M is not None else dummy_context_manager():
+        methods = {
+            "custom_exactsolve": custom_exactsolve,
+            "scipy_gmres": wrap_gmres,
+            "scipy_cg": wrap_cg,
+            "broyden1": broyden1_solve,
+            "cg": cg,
+            "blockcg": blockcg,
+            "minres": minres,
+            "bicgstab": bicgstab,
+            "gmres": gmres,
+        }
+        method_fcn = get_method("solve", methods, method)
+        return method_fcn(A, B, E, M, **config)
+
+def custom_exactsolve(A, B, E=None,
+                      M=None, **options):
+    # A: (*BA, na, na)
+    # B: (*BB, na, ncols)
+    # E: (*BE, ncols)
+    # M: (*BM, na, na)
+    return exactsolve(A, B, E, M)
+
+
+# docstring completion
+_solve_methods = {
+    "cg": cg,
+    "blockcg": blockcg,
+    "minres": minres,
+    "bicgstab": bicgstab,
+    "exactsolve": exactsolve,
+    "broyden1": broyden1_solve,
+    "scipy_gmres": wrap_gmres,
+    "scipy_cg": wrap_cg,
+    "gmres": gmres,
+}
+ignore_kwargs = ["E", "M", "mparams"]
+solve.__doc__ = get_methods_docstr(solve, _solve_methods, ignore_kwargs)